@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+"""ルームごとのアクター（メールボックス）
+
+同じルームへの操作は届いた順に1つずつ実行し、別のルームの操作は共有のワーカー上で
+並行に実行する。ゲームの状態に触れるのは常にそのルームのアクターだけなので、
+GameInstance 側にロックは要らない。
+
+ワーカーはメールボックスに仕事がある間だけ割り当てられ、BATCH 件ごとに譲るので、
+操作の多いルームが他のルームを待たせ続けることはない。
+"""
+
+import logging
+import threading
+from collections import deque
+
+BATCH = 32  # 1回の割り当てで処理する最大件数
+
+log = logging.getLogger(__name__)
+
+
+class RoomActor:
+    def __init__(self, spawn):
+        self.spawn = spawn  # fn -> ワーカー上で fn() を実行する（スレッドプールやgreenlet）
+        self.mailbox = deque()
+        self.lock = threading.Lock()
+        self.scheduled = False  # ワーカーに割り当て済みか
+
+    def submit(self, fn, *args):
+        """操作をメールボックスに入れる（必要ならワーカーに割り当てる）"""
+        with self.lock:
+            self.mailbox.append((fn, args))
+            if self.scheduled:
+                return
+            self.scheduled = True
+        self.spawn(self._drain)
+
+    def _drain(self):
+        for _ in range(BATCH):
+            with self.lock:
+                if not self.mailbox:
+                    self.scheduled = False
+                    return
+                fn, args = self.mailbox.popleft()
+            try:
+                fn(*args)
+            except Exception:
+                # 1つの操作の失敗でルーム全体を止めない
+                log.exception("room actor: %s failed", getattr(fn, "__name__", fn))
+        # まだ残っていれば他のルームに譲ってから続ける
+        with self.lock:
+            if not self.mailbox:
+                self.scheduled = False
+                return
+        self.spawn(self._drain)
+
+    def depth(self):
+        return len(self.mailbox)
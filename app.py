@@ -7,115 +7,125 @@ Original file is located at
     https://colab.research.google.com/drive/17xMLrQtghyYz1mFwe2gEQHcTT_rCykc7
 """
 
+import contextlib
+import functools
+import gc
+import hmac
+import os
 import random
-from flask import Flask, render_template, request
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from flask import Flask, jsonify, render_template, request
 from flask_socketio import SocketIO, emit, join_room, leave_room
+from cards import CARD_DB, CPU_DECK, get_prototype_deck, clone_deck
+from rules import effective_play_cost, legal_actions
+from zones import draw, move, put, shuffle, take, update_card
+import logevents as ev
+from outbound import OutboundQueue
+from actors import RoomActor
+from ratelimit import RateLimiter
+from timers import TimerWheel
+import profiling
+from profiling import profiled
 
 app = Flask(__name__)
 app.config['SECRET_KEY'] = 'kanzoku-kun-v3.1-ultimate'
-socketio = SocketIO(app)
+# threading / eventlet / gevent（未指定ならインストール済みのものから自動選択）
+ASYNC_MODE = os.environ.get('ATAKAMOVS_ASYNC_MODE') or None
+# イベントハンドラはルームのアクターに積むだけなので、受信順のまま呼ぶ（並行性はアクターが受け持つ）。
+# 既定の async_handlers=True だとイベントごとに別スレッドになり、同じクライアントの操作でも積む順が入れ替わる
+socketio = SocketIO(app, async_mode=ASYNC_MODE, async_handlers=False)
+# threading のときにルームのアクターを動かすスレッド数
+ROOM_WORKERS = int(os.environ.get('ATAKAMOVS_ROOM_WORKERS', '0')) or (os.cpu_count() or 1) * 4
+# 持ち時間（秒）。0なら無制限
+TURN_TIME_LIMIT = float(os.environ.get('ATAKAMOVS_TURN_TIME_LIMIT', '120'))
+SELECTION_TIME_LIMIT = float(os.environ.get('ATAKAMOVS_SELECTION_TIME_LIMIT', '60'))
+# 続けてこの回数だけ時間切れになったプレイヤーは投了扱い（放置されたルームを終わらせる）
+MAX_TIMEOUTS = int(os.environ.get('ATAKAMOVS_MAX_TIMEOUTS', '3'))
+
+# 管理者用API（プロファイリングなど）のトークン。未設定なら管理者APIは無効
+ADMIN_TOKEN = os.environ.get('ATAKAMOVS_ADMIN_TOKEN')
+
+# 事前構築済みの状態（warmup後に設定）
+INDEX_HTML = None  # レンダリング済みのトップページ
+ready = False
 
 # ルーム管理用の辞書
 rooms = {}  # {room_id: GameInstance}
 player_rooms = {}  # {sid: room_id} セッションIDからルームIDへのマッピング
 room_players = {}  # {room_id: {'p1': sid, 'p2': sid}} ルームごとのプレイヤー割り当て
-
-# --- 55種類のカードデータベース ---
-CARD_DB = [
-    {"id": "Newbie", "name": "新入社員", "cost": 1, "power": 1, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "【登場時】1枚引く。"},
-    {"id": "Staff", "name": "担当社員", "cost": 3, "power": 4, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "新入社員から進化(1)。"},
-    {"id": "Chief", "name": "主任技術者", "cost": 5, "power": 8, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "担当社員から進化(1)。維持費0。"},
-    {"id": "Senior", "name": "教育係の先輩", "cost": 2, "power": 3, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "新入社員のパワー+3。"},
-    {"id": "Ace", "name": "現場のエース", "cost": 4, "power": 12, "type": "MACHINE", "category": "人材", "upkeep": 2, "desc": "高出力な現場員。"},
-    {"id": "Leader", "name": "現場代理人", "cost": 6, "power": 15, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "パワーが高いが低維持費。"},
-    {"id": "Expert", "name": "ベテラン職人", "cost": 5, "power": 10, "type": "MACHINE", "category": "人材", "upkeep": 2, "desc": "安定した計測値。"},
-    {"id": "Clerk", "name": "事務員", "cost": 2, "power": 1, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "毎ターンAP+1回復。"},
-    {"id": "Intern", "name": "実習生", "cost": 0, "power": 0, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "コスト0の囮。"},
-    {"id": "SafetyOfficer", "name": "安全管理員", "cost": 3, "power": 2, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "現場の守り神。"},
-    {"id": "LevelBasic", "name": "普通のレベル", "cost": 1, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "基本機材。"},
-    {"id": "LevelAuto", "name": "オートレベル", "cost": 3, "power": 6, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "普通レベルから進化(1)。"},
-    {"id": "StaffBasic", "name": "アルミスタッフ", "cost": 1, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "基本スタッフ。"},
-    {"id": "StaffRef", "name": "反射スタッフ", "cost": 3, "power": 7, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "アルミから進化(1)。"},
-    {"id": "TS", "name": "光波TS", "cost": 4, "power": 10, "type": "MACHINE", "category": "機材", "upkeep": 2, "desc": "主力機材。"},
-    {"id": "GNSS", "name": "GNSS衛星", "cost": 6, "power": 18, "type": "MACHINE", "category": "機材", "upkeep": 3, "desc": "晴天時パワー+5。"},
-    {"id": "Drone", "name": "UAVドローン", "cost": 5, "power": 14, "type": "MACHINE", "category": "機材", "upkeep": 2, "desc": "濃霧の影響を受けない。"},
-    {"id": "Scanner", "name": "3Dスキャナ", "cost": 8, "power": 25, "type": "MACHINE", "category": "機材", "upkeep": 3, "desc": "最高クラスの出力。"},
-    {"id": "UsedTS", "name": "中古のTS", "cost": 2, "power": 12, "type": "MACHINE", "category": "機材", "upkeep": 2, "desc": "安価だが維持費がかさむ。"},
-    {"id": "Laser", "name": "レーザー墨出し", "cost": 2, "power": 5, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "室内で真価を発揮。"},
-    {"id": "Compass", "name": "コンパス", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "方位を計測。"},
-    {"id": "Tripod", "name": "三脚", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "機材の土台。"},
-    {"id": "Caliper", "name": "ノギス", "cost": 1, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "精密計測。"},
-    {"id": "Scale", "name": "スケール", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "基本。"},
-    {"id": "Chalk", "name": "チョーク", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "マーキング用。"},
-    {"id": "Excavator", "name": "バックホー", "cost": 7, "power": 20, "type": "MACHINE", "category": "機材", "upkeep": 4, "desc": "圧倒的パワー。"},
-    {"id": "Rental", "name": "レンタル重機", "cost": 3, "power": 15, "type": "MACHINE", "category": "機材", "upkeep": 5, "desc": "維持費が非常に高い。"},
-    {"id": "SmallTruck", "name": "軽トラ", "cost": 2, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "設置をスムーズにする。"},
-    {"id": "Concrete", "name": "生コン車", "cost": 5, "power": 10, "type": "MACHINE", "category": "機材", "upkeep": 3, "desc": "雨天時パワー-5。"},
-    {"id": "Pump", "name": "排水ポンプ", "cost": 3, "power": 0, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "豪雨のマイナスを無効化。"},
-    {"id": "GenSet", "name": "発電機", "cost": 3, "power": 3, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "他機材のパワー+2。"},
-    {"id": "Radio", "name": "無線機", "cost": 2, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "ドローンを強化。"},
-    {"id": "Lights", "name": "投光器", "cost": 3, "power": 4, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "後半でパワーアップ。"},
-    {"id": "Helmet", "name": "ヘルメット", "cost": 1, "power": 0, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "人材コストを軽減。"},
-    {"id": "Barrier", "name": "工事看板", "cost": 2, "power": 0, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "相手の行動を抑制。"},
-    {"id": "Elite", "name": "少数精鋭", "cost": 2, "power": 0, "type": "SPELL", "desc": "最大AP-1。2枚引く。"},
-    {"id": "Decision", "name": "苦渋の決断", "cost": 0, "power": 0, "type": "SPELL", "desc": "手札から強カードを捨て最大AP+2。"},
-    {"id": "Fund", "name": "資金調達", "cost": 4, "power": 0, "type": "SPELL", "desc": "永久に最大AP+1。"},
-    {"id": "Transceiver", "name": "トランシーバー", "cost": 1, "power": 0, "type": "SPELL", "desc": "デッキから1枚引く。"},
-    {"id": "Safety", "name": "安全巡回", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手の最大AP-1。"},
-    {"id": "Lost", "name": "紛失事故", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手のパワー10以上を1台破壊。"},
-    {"id": "Note", "name": "電子野帳", "cost": 1, "power": 0, "type": "SPELL", "desc": "カードを2枚引く。"},
-    {"id": "Repair", "name": "緊急修理", "cost": 2, "power": 0, "type": "SPELL", "desc": "APを5回復する。"},
-    {"id": "Check", "name": "Wチェック", "cost": 2, "power": 0, "type": "SPELL", "desc": "カードを3枚引く。"},
-    {"id": "Bush", "name": "藪払い", "cost": 2, "power": 0, "type": "SPELL", "desc": "相手の低コスト機を破壊。"},
-    {"id": "Rush", "name": "突貫工事", "cost": 0, "power": 0, "type": "SPELL", "desc": "このターンAP+4。終了時、場の1台自壊。"},
-    {"id": "Consult", "name": "気象予報", "cost": 1, "power": 0, "type": "SPELL", "desc": "次ターンの天候を晴天にする。"},
-    {"id": "Training", "name": "資格手当", "cost": 2, "power": 0, "type": "SPELL", "desc": "社員1人のパワー+5、維持費0化。"},
-    {"id": "NightWork", "name": "徹夜作業", "cost": 0, "power": 0, "type": "SPELL", "desc": "AP全快。ただし手札を全て捨てる。"},
-    {"id": "Complaint", "name": "近隣クレーム", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手のAPを3削る。"},
-    {"id": "Boundary", "name": "境界未確定", "cost": 2, "power": 0, "type": "SPELL", "desc": "相手の機材1つを2ターン停止。"},
-    {"id": "Overtime", "name": "残業指示", "cost": 0, "power": 0, "type": "SPELL", "desc": "1枚引いてAP+2。"},
-    {"id": "Audit", "name": "会計検査", "cost": 4, "power": 0, "type": "SPELL", "desc": "相手の最大APを2削る。"},
-    {"id": "BlueprintLoss", "name": "図面紛失", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手の手札を見て1枚捨てさせる。"},
-    {"id": "DataTheft", "name": "データ盗用", "cost": 2, "power": 0, "type": "SPELL", "desc": "相手の手札をランダムに1枚捨てさせる。"},
-    {"id": "AllOrNothing", "name": "一か八か", "cost": 0, "power": 0, "type": "SPELL", "desc": "コイントス。表なら5枚引く、裏なら手札全捨て＋場の機材1つランダム破壊。"},
-    {"id": "Recycle", "name": "機材リサイクル", "cost": 2, "power": 0, "type": "SPELL", "desc": "破壊された機材1つを手札に戻す。"},
-    {"id": "SurveyPlan", "name": "測量計画", "cost": 1, "power": 0, "type": "SPELL", "desc": "山札から3枚見て1枚を山札の一番上、残りを山札の一番下に。"},
-    {"id": "EmergencyOrder", "name": "緊急発注", "cost": 3, "power": 0, "type": "SPELL", "desc": "デッキから機材を1枚サーチして手札に。"},
-    {"id": "Dispatch", "name": "人材派遣", "cost": 2, "power": 0, "type": "SPELL", "desc": "デッキから社員を1枚サーチして手札に。"},
-    {"id": "FullyPrepared", "name": "準備万端", "cost": 5, "power": 0, "type": "SPELL", "desc": "場に異なる5種類のカードがあれば使用可。山札から勝利カードをサーチ。"},
-    {"id": "SurveyDB", "name": "測量データベース", "cost": 4, "power": 3, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "場にいる限り、毎ターン開始時に1枚引く。"},
-    {"id": "Demolition", "name": "解体工事", "cost": 4, "power": 0, "type": "SPELL", "desc": "相手の機材1つを破壊。"},
-    {"id": "Layoff", "name": "リストラ", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手の人材1人を破壊。"},
-    {"id": "Restructure", "name": "人員整理", "cost": 5, "power": 0, "type": "SPELL", "desc": "相手の人材を最大2人まで破壊。"},
-    {"id": "Removal", "name": "設備撤去", "cost": 6, "power": 0, "type": "SPELL", "desc": "相手の機材を最大2つまで破壊。"},
-    {"id": "SiteFire", "name": "現場火災", "cost": 7, "power": 0, "type": "SPELL", "desc": "相手の場のカード全てを破壊。自分の最大AP-2。"},
-    {"id": "Rehire", "name": "再雇用", "cost": 2, "power": 0, "type": "SPELL", "desc": "墓地から人材1人を手札に。"},
-    {"id": "Salvage", "name": "サルベージ", "cost": 4, "power": 0, "type": "SPELL", "desc": "墓地から任意のカード1枚を手札に。"},
-    {"id": "Recovery", "name": "復旧作業", "cost": 5, "power": 0, "type": "SPELL", "desc": "墓地から最大2枚を手札に。"},
-    {"id": "DataRestore", "name": "記録復元", "cost": 3, "power": 0, "type": "SPELL", "desc": "墓地からスペルカードを手札に。"},
-    {"id": "Goal30", "name": "工期内完遂", "cost": 4, "power": 0, "type": "GOAL", "desc": "スコア30以上で勝利。"},
-    {"id": "GoalFinal", "name": "社長決裁", "cost": 10, "power": 0, "type": "GOAL", "desc": "スコア10以上で勝利。"},
-]
-
-EVOLUTION_MAP = {"Staff": "Newbie", "Chief": "Staff", "LevelAuto": "LevelBasic", "StaffRef": "StaffBasic"}
+room_actors = {}  # {room_id: RoomActor} ルームの状態を変更する処理はすべてここを通す
+registry_lock = threading.Lock()  # 上の辞書へのルームの追加・参加を守る
+room_timers = {}  # {room_id: (局面, Timer)} 持ち時間のタイマー（ルームのアクターだけが触る）
+timers = TimerWheel()  # 全ルームの持ち時間を1つのタスクで進める
+timer_task = None
 
 class GameInstance:
+    """1ルーム分のゲーム状態
+
+    ゾーンはタプル、カードは差し替えのみ（zones.py）なので、スナップショットは
+    プレイヤーの辞書と小さな値をコピーするだけで取れる。ログは追記のみなので長さだけ覚えておく。
+    """
+
     def __init__(self):
         self.reset()
 
     def reset(self):
         self.players = {
-            "p1": {"ap": 2, "max_ap": 2, "score": 0, "hand": [], "field": [], "deck": [], "graveyard": [], "ready": False, "rush_used": False},
-            "p2": {"ap": 2, "max_ap": 2, "score": 0, "hand": [], "field": [], "deck": [], "graveyard": [], "ready": False, "rush_used": False}
+            "p1": {"ap": 2, "max_ap": 2, "score": 0, "hand": (), "field": (), "deck": (), "graveyard": (), "ready": False, "rush_used": False},
+            "p2": {"ap": 2, "max_ap": 2, "score": 0, "hand": (), "field": (), "deck": (), "graveyard": (), "ready": False, "rush_used": False}
         }
         self.turn = "p1"
         self.turn_count = 1
         self.weather = "晴天"
         self.next_weather = None
         self.winner = None
-        self.log = ["観測吝VS ULTIMATE Ver 4.1 開始！"]
+        self.log = [(ev.START, None, None)]  # (コード, プレイヤー, カードID, 引数...) 文章はクライアントで作る
         self.pending_selection = None  # {"type": "...", "player": "...", "targets": [...], "card_played": {...}}
         self.shakapachi_count = {"p1": 0, "p2": 0}  # しゃかぱちカウント
+        self.timeouts = {"p1": 0, "p2": 0}  # 続けて時間切れになった回数
+
+    def record(self, code, pid=None, card_id=None, *args):
+        """ログにイベントを追加する（logevents.py）"""
+        self.log.append((code, pid, card_id) + args)
+
+    def snapshot(self):
+        """現在の状態（ゾーンとカードは共有する）"""
+        sel = self.pending_selection
+        return (
+            {pid: dict(p) for pid, p in self.players.items()},
+            self.turn, self.turn_count, self.weather, self.next_weather, self.winner,
+            dict(sel) if sel else None,
+            dict(self.shakapachi_count), dict(self.timeouts),
+            self.log, len(self.log),
+        )
+
+    def restore(self, snap):
+        """snapshot() の時点に戻す（同じスナップショットから何度でも戻せる）"""
+        (players, self.turn, self.turn_count, self.weather, self.next_weather, self.winner,
+         sel, shakapachi_count, timeouts, self.log, log_len) = snap
+        self.players = {pid: dict(p) for pid, p in players.items()}
+        self.pending_selection = dict(sel) if sel else None
+        self.shakapachi_count = dict(shakapachi_count)
+        self.timeouts = dict(timeouts)
+        del self.log[log_len:]
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """ブロック内で例外が出たら開始時点の状態に戻す"""
+        snap = self.snapshot()
+        try:
+            yield
+        except BaseException:
+            self.restore(snap)
+            raise
+
+    def clone(self):
+        """探索用の複製（ゾーンとカードは共有し、ログだけ別にする）"""
+        other = GameInstance.__new__(GameInstance)
+        other.restore(self.snapshot())
+        other.log = list(self.log)
+        return other
 
 # グローバルなgameインスタンスは削除（ルーム管理に移行）
 
@@ -131,104 +141,418 @@ def get_player_room(sid):
     """セッションIDからルームIDを取得"""
     return player_rooms.get(sid)
 
+LOG_TAIL = 12  # 状態と一緒に送るログの件数（クライアントが表示する件数）
+
+def state_payload(game):
+    """クライアントに送る状態（両プレイヤーの合法手を含む）"""
+    return {
+        "players": game.players,
+        "turn": game.turn,
+        "turn_count": game.turn_count,
+        "weather": game.weather,
+        "next_weather": game.next_weather,
+        "winner": game.winner,
+        "log": game.log[-LOG_TAIL:],
+        "log_len": len(game.log),
+        "pending_selection": game.pending_selection,
+        "shakapachi_count": game.shakapachi_count,
+        "legal": {pid: legal_actions(game, pid) for pid in ("p1", "p2")},
+    }
+
+def room_sids(room_id):
+    """ルームに参加していて、まだ接続しているクライアントのsid"""
+    return [sid for sid in room_players.get(room_id, {}).values() if sid and player_rooms.get(sid) == room_id]
+
+def build_state(room_id):
+    game = rooms.get(room_id)
+    return state_payload(game) if game else None
+
+def _room_spawner():
+    """アクターを動かすワーカー（threadingならスレッドプール、eventlet/geventならgreenlet）"""
+    if socketio.async_mode == 'threading':
+        return ThreadPoolExecutor(max_workers=ROOM_WORKERS, thread_name_prefix='room').submit
+    return socketio.start_background_task
+
+spawn_room_task = _room_spawner()
+
+def submit_to_room(room_id, fn, *args):
+    """ルームのアクターで fn(*args) を実行する（ルームがなければ何もしない）"""
+    actor = room_actors.get(room_id)
+    if actor is not None:
+        actor.submit(fn, *args)
+
+# クライアントごとの送信キュー（update_uiは最新のみ、ack待ちは1つまで）
+outbound = OutboundQueue(socketio, build_state, room_sids, defer=submit_to_room, schedule=timers.schedule)
+
+def current_room():
+    """リクエスト中のクライアントのルームID"""
+    return get_player_room(request.sid)
+
+def current_sid():
+    return request.sid
+
+# イベントごとの流量制限 {event: {スコープ: (毎秒の補充量, 上限)}}
+RATE_LIMITS = {
+    'create_room': {'sid': (0.5, 3)},
+    'join_room': {'sid': (1, 5)},
+    'reset_game': {'sid': (0.2, 2), 'room': (0.2, 2)},
+    'shakapachi': {'sid': (2, 5), 'room': (4, 10)},
+    'submit_deck': {'sid': (1, 4)},  # CPU戦では同じクライアントが2人分提出する
+    'select_target': {'sid': (5, 10), 'room': (10, 20)},
+    'play_card': {'sid': (5, 10), 'room': (10, 20)},
+    'end_turn': {'sid': (2, 5), 'room': (4, 10)},
+}
+limiter = RateLimiter(RATE_LIMITS)
+
+def throttled(event):
+    """RATE_LIMITS に従ってハンドラの前で流量を制限する"""
+    return limiter.limit(event, current_sid, current_room)
+
+def in_room(fn):
+    """ハンドラをクライアントのルームのアクターで実行する
+
+    fn(game, room_id, sid, data) はリクエストの外で呼ばれるので、
+    request や emit は使わず sid 宛てに送ること。
+    元のハンドラは wrapper.action で呼べる（時間切れの処理などから使う）。
+    """
+    @functools.wraps(fn)
+    def wrapper(data=None):
+        sid = request.sid
+        room_id = get_player_room(sid)
+        submit_to_room(room_id, run_action, fn, room_id, sid, data)
+    wrapper.action = fn
+    return wrapper
+
+def run_action(fn, room_id, sid, data):
+    """ルームのアクター上でハンドラを実行する
+
+    途中で例外が出たら状態を処理前に戻し、クライアントに状態を送り直す。
+    終わったら局面に合わせて持ち時間のタイマーを掛け直す。
+    """
+    game = rooms.get(room_id)
+    if game is None:
+        return
+    try:
+        with game.transaction():
+            fn(game, room_id, sid, data)
+        pid = data.get('player_id') if isinstance(data, dict) else None
+        if pid in game.timeouts:
+            game.timeouts[pid] = 0  # 操作したプレイヤー（CPU戦では同じクライアントが両方）の時間切れは数え直す
+    except Exception:
+        outbound.send_state(room_id)
+        if sid:
+            outbound.send_event(sid, 'error', {'message': '操作を処理できませんでした'})
+        raise
+    finally:
+        arm_turn_timer(game, room_id)
+
+def action_room(game, room_id, *args):
+    """in_room のハンドラ引数からルームID（プロファイリングの絞り込み用）"""
+    return room_id
+
+def timer_phase(game):
+    """持ち時間の対象になる局面と制限秒数（対象がなければ (None, 0)）"""
+    if game.winner or not (game.players["p1"]["ready"] and game.players["p2"]["ready"]):
+        return None, 0
+    sel = game.pending_selection
+    if sel:
+        return (game.turn_count, game.turn, sel['type'], sel['player'], sel.get('count')), SELECTION_TIME_LIMIT
+    return (game.turn_count, game.turn), TURN_TIME_LIMIT
+
+def arm_turn_timer(game, room_id):
+    """局面が変わっていれば持ち時間を掛け直す（同じ局面の間は最初の期限のまま）"""
+    phase, limit = timer_phase(game)
+    current = room_timers.get(room_id)
+    if current is not None and current[0] == phase:
+        return
+    if current is not None:
+        timers.cancel(current[1])
+        del room_timers[room_id]
+    if phase is not None and limit > 0:
+        room_timers[room_id] = (phase, timers.schedule(limit, submit_to_room, room_id, expire_turn, room_id, phase))
+
+def expire_turn(room_id, phase):
+    """持ち時間切れ（タイマーからルームのアクターに回されて実行される）"""
+    current = room_timers.get(room_id)
+    if current is None or current[0] != phase:
+        return  # アクターに届くまでに局面が進んだ
+    del room_timers[room_id]
+    run_action(timeout_action, room_id, None, None)
+
+def start_timers():
+    """タイマーを進めるタスクを動かし始める（ワーカーで最初に必要になったとき。preloadのマスターでは動かさない）"""
+    global timer_task
+    with registry_lock:
+        if timer_task is None:
+            timer_task = socketio.start_background_task(timers.run, socketio.sleep)
+
+def schedule_task(delay, fn, *args):
+    """delay秒後に fn(*args) を別のバックグラウンドタスクで実行する（重い処理でタイマーを止めない）"""
+    return timers.schedule(delay, socketio.start_background_task, fn, *args)
+
+def close_room(room_id):
+    """片付けたルームのタイマーを止める（ルームのアクターで最後に実行される）"""
+    current = room_timers.pop(room_id, None)
+    if current is not None:
+        timers.cancel(current[1])
+
+def timeout_action(game, room_id, sid, data):
+    """選択待ちなら最初の候補を選び、そうでなければターンを終える
+
+    同じプレイヤーが MAX_TIMEOUTS 回続けて時間切れになったら、そのプレイヤーの負けにする。
+    """
+    sel = game.pending_selection
+    pid = sel['player'] if sel else game.turn
+    game.timeouts[pid] += 1
+    if MAX_TIMEOUTS and game.timeouts[pid] >= MAX_TIMEOUTS:
+        game.winner = 'p2' if pid == 'p1' else 'p1'
+        game.pending_selection = None
+        game.record(ev.FORFEIT, pid)
+        outbound.send_state(room_id)
+        return
+    if sel:
+        game.record(ev.TIMEOUT_SELECT, sel['player'])
+        handle_selection.action(game, room_id, sid, {'player_id': sel['player'], 'target_index': sel['targets'][0]})
+    else:
+        game.record(ev.TIMEOUT, game.turn)
+        end_turn.action(game, room_id, sid, {'player_id': game.turn})
+
+def is_admin():
+    token = request.headers.get('X-Admin-Token', '')
+    return bool(ADMIN_TOKEN) and hmac.compare_digest(token, ADMIN_TOKEN)
+
+# ログの文章化に使う表（ページに一度だけ埋め込む）
+CARD_NAMES = {c["id"]: c["name"] for c in CARD_DB}
+
+def render_index():
+    return render_template('ultimate.html', log_templates=ev.TEMPLATES, log_names=ev.NAMES, card_names=CARD_NAMES)
+
+def warmup():
+    """不変データを事前に構築してGCの対象から外す
+
+    gunicornのpreload時はfork前にマスターで1回だけ実行し、ワーカー間でページを共有させる。
+    """
+    global INDEX_HTML, ready
+    if ready:
+        return
+    # テンプレートのコンパイルとレンダリング（中身は固定なので結果ごと保持）
+    with app.test_request_context('/'):
+        INDEX_HTML = render_index()
+    # CPU戦のデッキはどのルームでも使うので先に組み立てておく
+    get_prototype_deck(CPU_DECK)
+    # ここまでに作ったオブジェクトをGCの走査対象から外す（参照カウント以外の書き込みを防ぐ）
+    gc.collect()
+    gc.freeze()
+    ready = True
+
+@app.before_request
+def warmup_on_first_request():
+    # gunicorn.conf.py や python app.py 以外（flask run など）で起動されたときは最初のリクエストで済ませる
+    if not ready:
+        warmup()
+
 @app.route('/')
 def index():
-    return render_template('ultimate.html')
+    # デバッグ時はテンプレートの変更を反映するため毎回レンダリング
+    if INDEX_HTML is None or app.debug:
+        return render_index()
+    return INDEX_HTML
+
+@app.route('/readyz')
+def readyz():
+    """ウォームアップ完了後にだけ200を返す"""
+    if not ready:
+        return jsonify({'ready': False}), 503
+    return jsonify({'ready': True})
+
+@app.route('/admin/profile', methods=['GET', 'POST', 'DELETE'])
+def admin_profile():
+    """ハンドラのプロファイリング（POST: 開始 / DELETE: 停止して書き出し / GET: 状態）"""
+    if not is_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    if request.method == 'POST':
+        body = request.get_json(silent=True)
+        if body is None:
+            body = {}
+        if not isinstance(body, dict):
+            return jsonify({'error': 'body must be a JSON object'}), 400
+        try:
+            seconds = int(body.get('seconds', 60))
+        except (TypeError, ValueError):
+            return jsonify({'error': 'seconds must be an integer'}), 400
+        start_timers()
+        try:
+            return jsonify(profiling.start(seconds, room_id=body.get('room_id'), events=body.get('events'),
+                                           schedule=schedule_task))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
+    if request.method == 'DELETE':
+        return jsonify({'active': False, 'written': profiling.stop()})
+    return jsonify(profiling.status())
+
+@app.route('/metrics')
+def metrics():
+    """送信キューの深さや流量制限の統計（管理者のみ）"""
+    if not is_admin():
+        return jsonify({'error': 'forbidden'}), 403
+    queued = sum(actor.depth() for actor in list(room_actors.values()))
+    return jsonify({'rooms': len(rooms), 'queued_actions': queued, 'timers': timers.metrics(),
+                    'outbound': outbound.metrics(), 'rate_limit': limiter.metrics()})
+
+@socketio.on('disconnect')
+def handle_disconnect(*args):
+    sid = request.sid
+    outbound.drop(sid)
+    limiter.drop('sid', sid)
+    with registry_lock:
+        _, closed = release_seat(sid)
+    drop_room(closed)
+
+def release_seat(sid):
+    """sid を今のルームから外し、誰も接続していなくなったルームは登録から外す（registry_lock の中で呼ぶ）
+
+    枠はそのまま（途中から別の人が入らないように）にする。
+    (元のルームID, 登録から外したルームの (ルームID, アクター) か None) を返す。
+    """
+    room_id = player_rooms.pop(sid, None)
+    if room_id in rooms and not room_sids(room_id):
+        del rooms[room_id], room_players[room_id]
+        return room_id, (room_id, room_actors.pop(room_id))
+    return room_id, None
+
+def seated_elsewhere(sid):
+    """sid が決着のついていないルームに相手と一緒にいるか（registry_lock の中で呼ぶ）
+
+    1つのクライアントが持てるルームは1つだけにする。1人だけのルームや決着したルームは
+    新しいルームに移るときに release_seat で外す。
+    """
+    room_id = player_rooms.get(sid)
+    game = rooms.get(room_id)
+    return game is not None and not game.winner and len(room_sids(room_id)) > 1
+
+def drop_room(closed):
+    """release_seat で外したルームの後始末（ロックの外で呼ぶ）"""
+    if closed is None:
+        return
+    room_id, actor = closed
+    limiter.drop('room', room_id)
+    actor.submit(close_room, room_id)
 
 @socketio.on('create_room')
+@throttled('create_room')
 def handle_create_room():
-    room_id = generate_room_id()
-    rooms[room_id] = GameInstance()
-    room_players[room_id] = {'p1': request.sid, 'p2': None}
-    player_rooms[request.sid] = room_id
+    start_timers()
+    with registry_lock:
+        if seated_elsewhere(request.sid):
+            error = '対戦中のルームがあります'
+        else:
+            # 前のルームの席は外す（誰もいなくなれば片付ける）
+            error = None
+            old_room, closed = release_seat(request.sid)
+            room_id = generate_room_id()
+            rooms[room_id] = GameInstance()
+            room_players[room_id] = {'p1': request.sid, 'p2': None}
+            room_actors[room_id] = RoomActor(spawn_room_task)
+            player_rooms[request.sid] = room_id
+    if error:
+        emit('error', {'message': error})
+        return
+    if old_room is not None:
+        leave_room(old_room)
+    drop_room(closed)
     join_room(room_id)
     emit('room_created', {'room_id': room_id, 'player_id': 'p1', 'waiting': True})
 
 @socketio.on('join_room')
+@throttled('join_room')
 def handle_join_room(data):
     room_id = data.get('room_id')
-    if room_id not in rooms:
-        emit('error', {'message': 'ルームが存在しません'})
-        return
-    
-    # すでに2人いる場合は拒否
-    if room_players[room_id]['p2'] is not None:
-        emit('error', {'message': 'ルームが満員です'})
+    # 確認と割り当てはまとめてロックの中で行う（送信はロックの外で）
+    with registry_lock:
+        if room_id not in rooms:
+            error = 'ルームが存在しません'
+        elif room_players[room_id]['p2'] is not None or player_rooms.get(request.sid) == room_id:
+            # すでに2人いる場合（自分が作ったルームを含む）は拒否
+            error = 'ルームが満員です'
+        elif seated_elsewhere(request.sid):
+            error = '対戦中のルームがあります'
+        else:
+            # 前のルームの席を外してからP2として参加
+            error = None
+            old_room, closed = release_seat(request.sid)
+            room_players[room_id]['p2'] = request.sid
+            player_rooms[request.sid] = room_id
+    if error:
+        emit('error', {'message': error})
         return
-    
-    # P2として参加
-    room_players[room_id]['p2'] = request.sid
-    player_rooms[request.sid] = room_id
+    if old_room is not None:
+        leave_room(old_room)
+    drop_room(closed)
     join_room(room_id)
     
     # 両方のプレイヤーに通知
     emit('room_joined', {'room_id': room_id, 'player_id': 'p2'})
-    emit('room_ready', {'room_id': room_id}, room=room_id)  # 全員に準備完了を通知
+    for sid in room_sids(room_id):  # 全員に準備完了を通知
+        outbound.send_event(sid, 'room_ready', {'room_id': room_id})
 
 @socketio.on('reset_game')
-def handle_reset():
-    room_id = get_player_room(request.sid)
-    if not room_id or room_id not in rooms:
-        return
-    rooms[room_id].reset()
-    emit('update_ui', vars(rooms[room_id]), room=room_id)
+@throttled('reset_game')
+@in_room
+def handle_reset(game, room_id, sid, data):
+    game.reset()
+    outbound.send_state(room_id)
 
 @socketio.on('shakapachi')
-def handle_shakapachi(data):
-    room_id = get_player_room(request.sid)
-    if not room_id or room_id not in rooms:
-        return
-    game = rooms[room_id]
-    
+@throttled('shakapachi')
+@in_room
+def handle_shakapachi(game, room_id, sid, data):
     pid = data['player_id']
     game.shakapachi_count[pid] += 1
     count = game.shakapachi_count[pid]
     
     # ログに追加
-    player_name = "P1" if pid == "p1" else "P2"
-    game.log.append(f"{player_name}しゃかぱち{count}回目")
+    game.record(ev.SHAKAPACHI, pid, None, count)
     
     # 相手に通知
     opponent_pid = "p2" if pid == "p1" else "p1"
     opponent_sid = room_players[room_id][opponent_pid]
     if opponent_sid:
-        emit('opponent_shakapachi', {'player_id': pid, 'count': count}, room=opponent_sid)
+        outbound.send_event(opponent_sid, 'opponent_shakapachi', {'player_id': pid, 'count': count})
     
     # 全員にUIアップデート
-    emit('update_ui', vars(game), room=room_id)
+    outbound.send_state(room_id)
 
 @socketio.on('submit_deck')
-def handle_deck(data):
-    room_id = get_player_room(request.sid)
-    if not room_id or room_id not in rooms:
-        return
-    game = rooms[room_id]
-    
+@throttled('submit_deck')
+@in_room
+@profiled('submit_deck', action_room)
+def handle_deck(game, room_id, sid, data):
     pid = data['player_id']
-    # カードをコピーしてデッキに追加（frozen属性を初期化）
-    game.players[pid]["deck"] = []
-    for cid in data['deck']:
-        card = dict(next(c for c in CARD_DB if c['id'] == cid))
-        card['frozen'] = 0
-        game.players[pid]["deck"].append(card)
-    random.shuffle(game.players[pid]["deck"])
+    # 検証済みプロトタイプを複製してデッキにする（同じデッキの再提出はキャッシュから）
+    try:
+        proto = get_prototype_deck(data.get('deck'))
+    except ValueError as e:
+        outbound.send_event(sid, 'error', {'message': str(e)})
+        return
+    deck = clone_deck(proto, pid)
+    random.shuffle(deck)
+    game.players[pid]["deck"] = tuple(deck)
     game.players[pid]["ready"] = True
     if game.players["p1"]["ready"] and game.players["p2"]["ready"]:
         # 先攻をランダムに決定
         game.turn = random.choice(["p1", "p2"])
-        game.log.append(f"先攻: {game.turn.upper()}")
+        game.record(ev.FIRST_PLAYER, game.turn)
         
         for p in ["p1", "p2"]:
-            game.players[p]["hand"] = [game.players[p]["deck"].pop(0) for _ in range(5) if game.players[p]["deck"]]
-    emit('update_ui', vars(game), room=room_id)
+            game.players[p]["hand"] = ()
+            draw(game.players[p], 5)
+    outbound.send_state(room_id)
 
 @socketio.on('select_target')
-def handle_selection(data):
-    room_id = get_player_room(request.sid)
-    if not room_id or room_id not in rooms:
-        return
-    game = rooms[room_id]
-    
+@throttled('select_target')
+@in_room
+@profiled('select_target', action_room)
+def handle_selection(game, room_id, sid, data):
     if not game.pending_selection or data['player_id'] != game.pending_selection['player']:
         return
     
@@ -243,9 +567,8 @@ def handle_selection(data):
     
     if sel['type'] == 'buff_ally':
         target = p['field'][target_idx]
-        target['power'] = target.get('power', 0) + 5
-        target['upkeep'] = 0
-        game.log.append(f"{pid.upper()}: {target['name']}を強化!")
+        target = update_card(p, 'field', target_idx, power=target.get('power', 0) + 5, upkeep=0)
+        game.record(ev.BUFF, pid, target['id'])
         # 勝利判定を再度チェック
         recalc_scores(game)
         if p['score'] >= 30:
@@ -254,22 +577,17 @@ def handle_selection(data):
     
     elif sel['type'] == 'destroy_enemy':
         opp = game.players[sel['target_player']]
-        destroyed = opp['field'][target_idx]
-        opp['field'].pop(target_idx)
-        opp['graveyard'].append(destroyed)  # 墓地に送る
-        game.log.append(f"{pid.upper()}: {destroyed['name']}を破壊!")
+        destroyed = move(opp, 'field', target_idx, 'graveyard')  # 墓地に送る
+        game.record(ev.DESTROY, pid, destroyed['id'])
     
     elif sel['type'] == 'freeze_enemy':
         opp = game.players[sel['target_player']]
-        target = opp['field'][target_idx]
-        target['frozen'] = 2
-        game.log.append(f"{pid.upper()}: {target['name']}を2ターン停止!")
+        target = update_card(opp, 'field', target_idx, frozen=2)
+        game.record(ev.FREEZE, pid, target['id'])
     
     elif sel['type'] == 'sacrifice_for_upkeep':
-        destroyed = p['field'][target_idx]
-        p['field'].pop(target_idx)
-        p['graveyard'].append(destroyed)  # 墓地に送る
-        game.log.append(f"{pid.upper()}: {destroyed['name']}を破棄")
+        destroyed = move(p, 'field', target_idx, 'graveyard')  # 墓地に送る
+        game.record(ev.SACRIFICE, pid, destroyed['id'])
         # 再計算
         upkeep = sum(c.get('upkeep', 0) for c in p['field'])
         clerk_bonus = sum(1 for c in p['field'] if c['id'] == 'Clerk')
@@ -281,27 +599,24 @@ def handle_selection(data):
                 'player': pid,
                 'targets': list(range(len(p['field'])))
             }
-            game.log.append(f"{pid.upper()}: まだ維持費不足！さらに破棄")
+            game.record(ev.UPKEEP_STILL_SHORT, pid)
             recalc_scores(game)
-            emit('update_ui', vars(game), room=room_id)
+            outbound.send_state(room_id)
             return
         # 維持費支払い完了、ドロー続行
         game.pending_selection = None
-        if p['deck']: 
-            p['hand'].append(p['deck'].pop(0))
+        draw(p)
         recalc_scores(game)
-        emit('update_ui', vars(game), room=room_id)
+        outbound.send_state(room_id)
         return
     
     elif sel['type'] == 'sacrifice_for_rush':
-        destroyed = p['field'][target_idx]
-        p['field'].pop(target_idx)
-        p['graveyard'].append(destroyed)  # 墓地に送る
-        game.log.append(f"{pid.upper()}: 突貫工事の反動で{destroyed['name']}が破壊")
+        destroyed = move(p, 'field', target_idx, 'graveyard')  # 墓地に送る
+        game.record(ev.RUSH_DESTROYED, pid, destroyed['id'])
         # Rush終了後、ターン終了処理を続行
         game.pending_selection = None
         recalc_scores(game)
-        emit('update_ui', vars(game), room=room_id)
+        outbound.send_state(room_id)
         # ターンを切り替える
         end_turn_internal(game, pid, room_id)
         return
@@ -309,64 +624,47 @@ def handle_selection(data):
     elif sel['type'] == 'discard_enemy_hand':
         # 図面紛失：相手の手札を捨てる
         opp = game.players[sel['target_player']]
-        discarded = opp['hand'][target_idx]
-        opp['hand'].pop(target_idx)
-        game.log.append(f"{pid.upper()}: 相手の{discarded['name']}を捨てさせた!")
+        discarded = take(opp, 'hand', target_idx)
+        game.record(ev.DISCARD_ENEMY_HAND, pid, discarded['id'])
     
     elif sel['type'] == 'recycle_from_graveyard':
         # 機材リサイクル：墓地から手札に戻す
-        recycled = p['graveyard'][target_idx]
-        p['graveyard'].pop(target_idx)
-        p['hand'].append(recycled)
-        game.log.append(f"{pid.upper()}: {recycled['name']}を墓地から回収!")
+        recycled = move(p, 'graveyard', target_idx, 'hand')
+        game.record(ev.RECYCLE, pid, recycled['id'])
     
     elif sel['type'] == 'survey_plan':
         # 測量計画：選んだカードを山札の一番上に
         top_cards = sel['top_cards']
         selected = top_cards[target_idx]
-        # 山札の上3枚を削除
-        p['deck'] = p['deck'][3:]
-        # 選んだカードを一番上に
-        p['deck'].insert(0, selected)
-        # 残りを一番下に
-        for i, card in enumerate(top_cards):
-            if i != target_idx:
-                p['deck'].append(card)
-        game.log.append(f"{pid.upper()}: 山札を整理した!")
+        rest = tuple(card for i, card in enumerate(top_cards) if i != target_idx)
+        # 山札の上3枚を除き、選んだカードを一番上に、残りを一番下に
+        p['deck'] = (selected,) + p['deck'][3:] + rest
+        game.record(ev.SURVEY, pid)
     
     elif sel['type'] == 'search_deck':
         # デッキサーチ：選んだカードを手札に
-        searched = p['deck'][target_idx]
-        p['deck'].pop(target_idx)
-        p['hand'].append(searched)
-        import random
-        random.shuffle(p['deck'])  # デッキをシャッフル
-        game.log.append(f"{pid.upper()}: {searched['name']}をサーチ!")
+        searched = move(p, 'deck', target_idx, 'hand')
+        shuffle(p, 'deck')  # デッキをシャッフル
+        game.record(ev.SEARCH, pid, searched['id'])
     
     elif sel['type'] == 'destroy_enemy_equipment':
         # 解体工事：相手の機材を破壊
         opp = game.players[sel['target_player']]
-        destroyed = opp['field'][target_idx]
-        opp['field'].pop(target_idx)
-        opp['graveyard'].append(destroyed)
-        game.log.append(f"{pid.upper()}: 相手の{destroyed['name']}を破壊!")
+        destroyed = move(opp, 'field', target_idx, 'graveyard')
+        game.record(ev.DESTROY_ENEMY, pid, destroyed['id'])
     
     elif sel['type'] == 'destroy_enemy_personnel':
         # リストラ：相手の人材を破壊
         opp = game.players[sel['target_player']]
-        destroyed = opp['field'][target_idx]
-        opp['field'].pop(target_idx)
-        opp['graveyard'].append(destroyed)
-        game.log.append(f"{pid.upper()}: 相手の{destroyed['name']}を解雇!")
+        destroyed = move(opp, 'field', target_idx, 'graveyard')
+        game.record(ev.FIRE_ENEMY, pid, destroyed['id'])
     
     elif sel['type'] == 'destroy_multi_personnel':
         # 人員整理：複数の人材を破壊
         opp = game.players[sel['target_player']]
-        destroyed = opp['field'][target_idx]
-        opp['field'].pop(target_idx)
-        opp['graveyard'].append(destroyed)
+        destroyed = move(opp, 'field', target_idx, 'graveyard')
         sel['count'] += 1
-        game.log.append(f"{pid.upper()}: 相手の{destroyed['name']}を解雇!")
+        game.record(ev.FIRE_ENEMY, pid, destroyed['id'])
         
         # まだ選択可能で、選択を続けるか確認
         if sel['count'] < sel['max_count'] and opp['field']:
@@ -374,17 +672,15 @@ def handle_selection(data):
             personnel = [i for i, c in enumerate(opp['field']) if c.get('category') == '人材']
             if personnel:
                 sel['targets'] = personnel
-                emit('update_ui', vars(game), room=room_id)
+                outbound.send_state(room_id)
                 return
     
     elif sel['type'] == 'destroy_multi_equipment':
         # 設備撤去：複数の機材を破壊
         opp = game.players[sel['target_player']]
-        destroyed = opp['field'][target_idx]
-        opp['field'].pop(target_idx)
-        opp['graveyard'].append(destroyed)
+        destroyed = move(opp, 'field', target_idx, 'graveyard')
         sel['count'] += 1
-        game.log.append(f"{pid.upper()}: 相手の{destroyed['name']}を撤去!")
+        game.record(ev.REMOVE_ENEMY, pid, destroyed['id'])
         
         # まだ選択可能で、選択を続けるか確認
         if sel['count'] < sel['max_count'] and opp['field']:
@@ -392,132 +688,107 @@ def handle_selection(data):
             machines = [i for i, c in enumerate(opp['field']) if c.get('category') == '機材']
             if machines:
                 sel['targets'] = machines
-                emit('update_ui', vars(game), room=room_id)
+                outbound.send_state(room_id)
                 return
     
     elif sel['type'] == 'recover_personnel':
         # 再雇用：墓地から人材を回収
-        recovered = p['graveyard'][target_idx]
-        p['graveyard'].pop(target_idx)
-        p['hand'].append(recovered)
-        game.log.append(f"{pid.upper()}: {recovered['name']}を再雇用!")
+        recovered = move(p, 'graveyard', target_idx, 'hand')
+        game.record(ev.REHIRE, pid, recovered['id'])
     
     elif sel['type'] == 'recover_any':
         # サルベージ：墓地から任意のカードを回収
-        recovered = p['graveyard'][target_idx]
-        p['graveyard'].pop(target_idx)
-        p['hand'].append(recovered)
-        game.log.append(f"{pid.upper()}: {recovered['name']}を回収!")
+        recovered = move(p, 'graveyard', target_idx, 'hand')
+        game.record(ev.RECOVER, pid, recovered['id'])
     
     elif sel['type'] == 'recover_multi':
         # 復旧作業：墓地から複数回収
-        recovered = p['graveyard'][target_idx]
-        p['graveyard'].pop(target_idx)
-        p['hand'].append(recovered)
+        recovered = move(p, 'graveyard', target_idx, 'hand')
         sel['count'] += 1
-        game.log.append(f"{pid.upper()}: {recovered['name']}を回収!")
+        game.record(ev.RECOVER, pid, recovered['id'])
         
         # まだ選択可能で、選択を続けるか確認
         if sel['count'] < sel['max_count'] and p['graveyard']:
             sel['targets'] = list(range(len(p['graveyard'])))
-            emit('update_ui', vars(game), room=room_id)
+            outbound.send_state(room_id)
             return
     
     elif sel['type'] == 'recover_spell':
         # 記録復元：墓地からスペルを回収
-        recovered = p['graveyard'][target_idx]
-        p['graveyard'].pop(target_idx)
-        p['hand'].append(recovered)
-        game.log.append(f"{pid.upper()}: {recovered['name']}を復元!")
+        recovered = move(p, 'graveyard', target_idx, 'hand')
+        game.record(ev.RESTORE, pid, recovered['id'])
     
     game.pending_selection = None
     recalc_scores(game)
-    emit('update_ui', vars(game), room=room_id)
+    outbound.send_state(room_id)
 
 @socketio.on('play_card')
-def handle_play(data):
-    room_id = get_player_room(request.sid)
-    if not room_id or room_id not in rooms:
-        return
-    game = rooms[room_id]
-    
+@throttled('play_card')
+@in_room
+@profiled('play_card', action_room)
+def handle_play(game, room_id, sid, data):
     pid, idx = data['player_id'], data['card_index']
-    if pid != game.turn or game.winner: return
+    if pid != game.turn or game.winner or game.pending_selection: return
     p = game.players[pid]
+    if not isinstance(idx, int) or not 0 <= idx < len(p["hand"]): return
     card = p["hand"][idx]
 
     # 豪雨時はスペルカード使用禁止
     if game.weather == "豪雨" and card["type"] == "SPELL":
-        game.log.append(f"{pid.upper()}: スペル使用不可！(豪雨)")
-        emit('update_ui', vars(game), room=room_id)
+        game.record(ev.SPELL_BANNED, pid, card['id'])
+        outbound.send_state(room_id)
         return
 
-    play_cost = card["cost"]
-    evolve_target_idx = -1
-    is_evolution = False
-
-    if card["id"] in EVOLUTION_MAP:
-        base_id = EVOLUTION_MAP[card["id"]]
-        for i, f in enumerate(p["field"]):
-            if f["id"] == base_id:
-                play_cost, evolve_target_idx, is_evolution = 1, i, True
-                break
-    
-    # ヘルメット効果：人材のコスト-1
-    if card.get("category") == "人材":
-        helmet_count = sum(1 for f in p["field"] if f["id"] == "Helmet")
-        play_cost = max(0, play_cost - helmet_count)
+    # 進化・ヘルメット込みの実コスト（合法手の計算と共通）
+    play_cost, evolve_target_idx = effective_play_cost(p, card)
+    is_evolution = evolve_target_idx >= 0
 
     if p["ap"] >= play_cost:
-        card = p["hand"].pop(idx)
+        card = take(p, "hand", idx)
         p["ap"] -= play_cost
         if is_evolution:
-            p["field"].pop(evolve_target_idx)
-            card["frozen"] = 0  # 停止状態初期化
-            p["field"].append(card)
-            game.log.append(f"{pid.upper()}: {card['name']} (進化召喚!)")
+            take(p, "field", evolve_target_idx)
+            card = dict(card, frozen=0)  # 停止状態初期化
+            put(p, "field", card)
+            game.record(ev.EVOLVE, pid, card['id'])
         else:
             if card["type"] == "MACHINE": 
-                card["frozen"] = 0  # 停止状態初期化
-                p["field"].append(card)
+                card = dict(card, frozen=0)  # 停止状態初期化
+                put(p, "field", card)
             
             # カード効果の実装
             if card["id"] == "Newbie" and p["deck"]: 
-                p["hand"].append(p["deck"].pop(0))
+                draw(p)
             elif card["id"] == "Elite":
                 p["max_ap"] = max(1, p["max_ap"]-1)
-                for _ in range(2): 
-                    if p["deck"]: p["hand"].append(p["deck"].pop(0))
+                draw(p, 2)
             elif card["id"] == "Fund": 
                 p["max_ap"] += 1
             elif card["id"] == "Note":
-                for _ in range(2):
-                    if p["deck"]: p["hand"].append(p["deck"].pop(0))
+                draw(p, 2)
             elif card["id"] == "Check":
-                for _ in range(3):
-                    if p["deck"]: p["hand"].append(p["deck"].pop(0))
+                draw(p, 3)
             elif card["id"] == "Transceiver" and p["deck"]:
-                p["hand"].append(p["deck"].pop(0))
+                draw(p)
             elif card["id"] == "Repair": 
                 p["ap"] = min(p["max_ap"], p["ap"] + 5)
             elif card["id"] == "Rush": 
                 p["ap"] = min(p["max_ap"], p["ap"] + 4)
                 p["rush_used"] = True
-                game.log.append(f"{pid.upper()}: ターン終了時に1台破壊される")
+                game.record(ev.RUSH_WARNING, pid)
             elif card["id"] == "Decision": 
                 p["max_ap"] += 2
             elif card["id"] == "Overtime":
-                if p["deck"]: p["hand"].append(p["deck"].pop(0))
+                draw(p)
                 p["ap"] = min(p["max_ap"], p["ap"] + 2)
             elif card["id"] == "NightWork":
-                p["hand"] = []
+                p["hand"] = ()
                 p["ap"] = p["max_ap"]
                 # 2枚ドロー
-                for _ in range(2):
-                    if p["deck"]: p["hand"].append(p["deck"].pop(0))
+                draw(p, 2)
             elif card["id"] == "Consult":
                 game.next_weather = "晴天"
-                game.log.append(f"{pid.upper()}: 次ターンは晴天!")
+                game.record(ev.NEXT_SUNNY, pid)
             elif card["id"] == "Training":
                 # 人材を強化（category="人材"）
                 personnel = [i for i, c in enumerate(p["field"]) if c.get("category") == "人材"]
@@ -528,13 +799,13 @@ def handle_play(data):
                         "targets": personnel,
                         "card_id": "Training"
                     }
-                    game.log.append(f"{pid.upper()}: 強化する人材を選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_BUFF, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Safety":
                 opp = game.players["p2" if pid == "p1" else "p1"]
                 opp["max_ap"] = max(1, opp["max_ap"] - 1)
-                game.log.append(f"{pid.upper()}: 相手の最大AP-1")
+                game.record(ev.OPP_MAX_AP_1, pid)
             elif card["id"] == "Lost":
                 opp = game.players["p2" if pid == "p1" else "p1"]
                 targets = [i for i, c in enumerate(opp["field"]) if c.get("power", 0) >= 10]
@@ -546,8 +817,8 @@ def handle_play(data):
                         "targets": targets,
                         "card_id": "Lost"
                     }
-                    game.log.append(f"{pid.upper()}: 紛失させる機材を選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_LOST, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Bush":
                 opp = game.players["p2" if pid == "p1" else "p1"]
@@ -560,13 +831,13 @@ def handle_play(data):
                         "targets": targets,
                         "card_id": "Bush"
                     }
-                    game.log.append(f"{pid.upper()}: 破壊する機材を選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_BUSH, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Complaint":
                 opp = game.players["p2" if pid == "p1" else "p1"]
                 opp["ap"] = max(0, opp["ap"] - 3)
-                game.log.append(f"{pid.upper()}: 相手のAPを3削った!")
+                game.record(ev.OPP_AP_3, pid)
             elif card["id"] == "Boundary":
                 opp = game.players["p2" if pid == "p1" else "p1"]
                 if opp["field"]:
@@ -577,13 +848,13 @@ def handle_play(data):
                         "targets": list(range(len(opp["field"]))),
                         "card_id": "Boundary"
                     }
-                    game.log.append(f"{pid.upper()}: 停止する機材を選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_FREEZE, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Audit":
                 opp = game.players["p2" if pid == "p1" else "p1"]
                 opp["max_ap"] = max(1, opp["max_ap"] - 2)
-                game.log.append(f"{pid.upper()}: 相手の最大APを2削った!")
+                game.record(ev.OPP_MAX_AP_2, pid)
             elif card["id"] == "BlueprintLoss":
                 # 図面紛失：相手の手札を見て1枚捨てさせる
                 opp = game.players["p2" if pid == "p1" else "p1"]
@@ -595,33 +866,31 @@ def handle_play(data):
                         "targets": list(range(len(opp["hand"]))),
                         "card_id": "BlueprintLoss"
                     }
-                    game.log.append(f"{pid.upper()}: 相手の手札を見て1枚選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_ENEMY_HAND, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "DataTheft":
                 # データ盗用：相手の手札をランダムに1枚捨てさせる
                 opp = game.players["p2" if pid == "p1" else "p1"]
                 if opp["hand"]:
                     import random
-                    discarded = opp["hand"].pop(random.randint(0, len(opp["hand"]) - 1))
-                    game.log.append(f"{pid.upper()}: {discarded['name']}を盗んで捨てた!")
+                    discarded = take(opp, "hand", random.randint(0, len(opp["hand"]) - 1))
+                    game.record(ev.THEFT, pid, discarded['id'])
             elif card["id"] == "AllOrNothing":
                 # 一か八か：コイントス
                 import random
                 result = random.choice([True, False])
                 if result:  # 表
-                    for _ in range(5):
-                        if p["deck"]: p["hand"].append(p["deck"].pop(0))
-                    game.log.append(f"{pid.upper()}: コイントス成功！5枚引いた!")
+                    draw(p, 5)
+                    game.record(ev.COIN_WIN, pid)
                 else:  # 裏
-                    p["hand"] = []
+                    p["hand"] = ()
                     if p["field"]:
                         destroyed_idx = random.randint(0, len(p["field"]) - 1)
-                        destroyed = p["field"].pop(destroyed_idx)
-                        p["graveyard"].append(destroyed)
-                        game.log.append(f"{pid.upper()}: コイントス失敗！手札全捨て＋{destroyed['name']}破壊!")
+                        destroyed = move(p, "field", destroyed_idx, "graveyard")
+                        game.record(ev.COIN_LOSE_DESTROY, pid, destroyed['id'])
                     else:
-                        game.log.append(f"{pid.upper()}: コイントス失敗！手札全捨て!")
+                        game.record(ev.COIN_LOSE, pid)
             elif card["id"] == "Recycle":
                 # 機材リサイクル：墓地から機材を1つ手札に戻す
                 graveyard_machines = [i for i, c in enumerate(p["graveyard"]) if c.get("category") == "機材"]
@@ -632,8 +901,8 @@ def handle_play(data):
                         "targets": graveyard_machines,
                         "card_id": "Recycle"
                     }
-                    game.log.append(f"{pid.upper()}: 墓地から機材を1つ選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_RECYCLE, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "SurveyPlan":
                 # 測量計画：山札から3枚見て1枚を山札の一番上、残りを山札の一番下に
@@ -645,8 +914,8 @@ def handle_play(data):
                         "top_cards": [p["deck"][0], p["deck"][1], p["deck"][2]],
                         "card_id": "SurveyPlan"
                     }
-                    game.log.append(f"{pid.upper()}: 山札の上3枚から1枚選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_SURVEY, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "EmergencyOrder":
                 # 緊急発注：デッキから機材を1枚サーチ
@@ -658,8 +927,8 @@ def handle_play(data):
                         "targets": machines,
                         "card_id": "EmergencyOrder"
                     }
-                    game.log.append(f"{pid.upper()}: デッキから機材を1枚選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_SEARCH_MACHINE, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Dispatch":
                 # 人材派遣：デッキから人材を1枚サーチ
@@ -671,8 +940,8 @@ def handle_play(data):
                         "targets": personnel,
                         "card_id": "Dispatch"
                     }
-                    game.log.append(f"{pid.upper()}: デッキから人材を1枚選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_SEARCH_PERSONNEL, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "FullyPrepared":
                 # 準備万端：場に異なる5種類のカードがあればデッキから勝利カードをサーチ
@@ -686,11 +955,11 @@ def handle_play(data):
                             "targets": goals,
                             "card_id": "FullyPrepared"
                         }
-                        game.log.append(f"{pid.upper()}: デッキから勝利カードを1枚選んでください")
-                        emit('update_ui', vars(game), room=room_id)
+                        game.record(ev.SELECT_SEARCH_GOAL, pid)
+                        outbound.send_state(room_id)
                         return
                 else:
-                    game.log.append(f"{pid.upper()}: 場のカード種類が不足！({len(unique_cards)}/5)")
+                    game.record(ev.VARIETY_SHORT, pid, None, len(unique_cards))
             elif card["id"] == "Demolition":
                 # 解体工事：相手の機材1つを破壊
                 opp = game.players["p2" if pid == "p1" else "p1"]
@@ -703,8 +972,8 @@ def handle_play(data):
                         "targets": machines,
                         "card_id": "Demolition"
                     }
-                    game.log.append(f"{pid.upper()}: 破壊する相手の機材を選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_DEMOLITION, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Layoff":
                 # リストラ：相手の人材1人を破壊
@@ -718,8 +987,8 @@ def handle_play(data):
                         "targets": personnel,
                         "card_id": "Layoff"
                     }
-                    game.log.append(f"{pid.upper()}: 破壊する相手の人材を選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_LAYOFF, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Restructure":
                 # 人員整理：相手の人材を最大2人まで破壊
@@ -735,8 +1004,8 @@ def handle_play(data):
                         "max_count": min(2, len(personnel)),
                         "card_id": "Restructure"
                     }
-                    game.log.append(f"{pid.upper()}: 破壊する人材を選んでください（最大2人）")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_RESTRUCTURE, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Removal":
                 # 設備撤去：相手の機材を最大2つまで破壊
@@ -752,19 +1021,18 @@ def handle_play(data):
                         "max_count": min(2, len(machines)),
                         "card_id": "Removal"
                     }
-                    game.log.append(f"{pid.upper()}: 破壊する機材を選んでください（最大2つ）")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_REMOVAL, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "SiteFire":
                 # 現場火災：相手の場のカード全てを破壊、自分の最大AP-2
                 opp = game.players["p2" if pid == "p1" else "p1"]
                 destroyed_count = len(opp["field"])
-                for c in opp["field"]:
-                    opp["graveyard"].append(c)
-                opp["field"] = []
+                put(opp, "graveyard", *opp["field"])
+                opp["field"] = ()
                 p["max_ap"] = max(1, p["max_ap"] - 2)
-                game.log.append(f"{pid.upper()}: 現場火災で相手の場を全滅させた！（{destroyed_count}枚破壊）")
-                game.log.append(f"{pid.upper()}: 自分の最大AP-2")
+                game.record(ev.SITE_FIRE, pid, None, destroyed_count)
+                game.record(ev.SELF_MAX_AP_2, pid)
             elif card["id"] == "Rehire":
                 # 再雇用：墓地から人材1人を手札に
                 personnel = [i for i, c in enumerate(p["graveyard"]) if c.get("category") == "人材"]
@@ -775,8 +1043,8 @@ def handle_play(data):
                         "targets": personnel,
                         "card_id": "Rehire"
                     }
-                    game.log.append(f"{pid.upper()}: 回収する人材を選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_REHIRE, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Salvage":
                 # サルベージ：墓地から任意のカード1枚を手札に
@@ -787,8 +1055,8 @@ def handle_play(data):
                         "targets": list(range(len(p["graveyard"]))),
                         "card_id": "Salvage"
                     }
-                    game.log.append(f"{pid.upper()}: 回収するカードを選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_SALVAGE, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "Recovery":
                 # 復旧作業：墓地から最大2枚を手札に
@@ -801,8 +1069,8 @@ def handle_play(data):
                         "max_count": min(2, len(p["graveyard"])),
                         "card_id": "Recovery"
                     }
-                    game.log.append(f"{pid.upper()}: 回収するカードを選んでください（最大2枚）")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_RECOVERY, pid)
+                    outbound.send_state(room_id)
                     return
             elif card["id"] == "DataRestore":
                 # 記録復元：墓地からスペルカードを手札に
@@ -814,23 +1082,23 @@ def handle_play(data):
                         "targets": spells,
                         "card_id": "DataRestore"
                     }
-                    game.log.append(f"{pid.upper()}: 回収するスペルを選んでください")
-                    emit('update_ui', vars(game), room=room_id)
+                    game.record(ev.SELECT_DATA_RESTORE, pid)
+                    outbound.send_state(room_id)
                     return
 
             # 通常のログ記録（進化以外）
             if not is_evolution:
-                game.log.append(f"{pid.upper()}: {card['name']}")
+                game.record(ev.PLAY, pid, card['id'])
         
         # 勝利条件判定
         if card["id"] == "GoalFinal" and p["score"] >= 10: 
             game.winner = pid
-            game.log.append(f"{pid.upper()}: 社長決裁で勝利!")
+            game.record(ev.WIN_FINAL, pid)
         if card["id"] == "Goal30" and p["score"] >= 30: 
             game.winner = pid
-            game.log.append(f"{pid.upper()}: 工期完遂で勝利!")
+            game.record(ev.WIN_30, pid)
         recalc_scores(game)
-    emit('update_ui', vars(game), room=room_id)
+    outbound.send_state(room_id)
 
 def recalc_scores(game):
     for pid in ["p1", "p2"]:
@@ -877,13 +1145,12 @@ def recalc_scores(game):
         p["score"] = s
 
 @socketio.on('end_turn')
-def end_turn(data):
-    room_id = get_player_room(request.sid)
-    if not room_id or room_id not in rooms:
-        return
-    game = rooms[room_id]
-    
-    if data['player_id'] != game.turn or game.winner: return
+@throttled('end_turn')
+@in_room
+@profiled('end_turn', action_room)
+def end_turn(game, room_id, sid, data):
+    # 選択待ち（維持費の支払いなど）の間は終了できない（rules.legal_actions の can_end_turn と同じ条件）
+    if data['player_id'] != game.turn or game.winner or game.pending_selection: return
     
     # Rush効果: 自分のターン終了時に場の1台を破壊
     current_player = game.players[game.turn]
@@ -894,8 +1161,8 @@ def end_turn(data):
             "targets": list(range(len(current_player["field"])))
         }
         current_player["rush_used"] = False
-        game.log.append(f"{game.turn.upper()}: 突貫工事の反動！破壊するカードを選んでください")
-        emit('update_ui', vars(game), room=room_id)
+        game.record(ev.SELECT_RUSH, game.turn)
+        outbound.send_state(room_id)
         return
     
     end_turn_internal(game, data['player_id'], room_id)
@@ -913,16 +1180,16 @@ def end_turn_internal(game, player_id, room_id):
             game.next_weather = None
         else:
             game.weather = random.choice(["晴天", "晴天", "豪雨", "濃霧"])
-        game.log.append(f"--- Day {game.turn_count} 天候: {game.weather} ---")
+        game.record(ev.DAY, None, None, game.turn_count, ev.WEATHER_CODES[game.weather])
     
     p = game.players[game.turn]
     
     # 停止カウンターを減少
-    for c in p["field"]:
+    for i, c in enumerate(p["field"]):
         if c.get("frozen", 0) > 0:
-            c["frozen"] -= 1
+            c = update_card(p, "field", i, frozen=c["frozen"] - 1)
             if c["frozen"] == 0:
-                game.log.append(f"{game.turn.upper()}: {c['name']}が復帰!")
+                game.record(ev.THAW, game.turn, c['id'])
     
     p["max_ap"] = min(p["max_ap"] + 1, 15)
     
@@ -938,22 +1205,21 @@ def end_turn_internal(game, player_id, room_id):
             "player": game.turn,
             "targets": list(range(len(p["field"])))
         }
-        game.log.append(f"{game.turn.upper()}: 維持費不足！破棄するカードを選んでください")
-        emit('update_ui', vars(game), room=room_id)
+        game.record(ev.SELECT_UPKEEP, game.turn)
+        outbound.send_state(room_id)
         return
     
     # ドローフェーズ
-    if p["deck"]: 
-        p["hand"].append(p["deck"].pop(0))
+    draw(p)
     
     # 測量データベースの効果：場にあれば追加ドロー
     if any(c["id"] == "SurveyDB" for c in p["field"]):
-        if p["deck"]:
-            p["hand"].append(p["deck"].pop(0))
-            game.log.append(f"{game.turn.upper()}: 測量データベースで追加ドロー!")
+        if draw(p):
+            game.record(ev.SURVEY_DB_DRAW, game.turn)
     
     recalc_scores(game)
-    emit('update_ui', vars(game), room=room_id)
+    outbound.send_state(room_id)
 
 if __name__ == '__main__':
+    warmup()
     socketio.run(app, debug=True, host='0.0.0.0', port=5000)
@@ -0,0 +1,167 @@
+# -*- coding: utf-8 -*-
+"""カードカタログとデッキ検証
+
+サーバー・シミュレーター共通で使う不変データ（Flaskに依存しない）。
+"""
+
+from collections import OrderedDict
+import threading
+
+# --- 55種類のカードデータベース ---
+CARD_DB = [
+    {"id": "Newbie", "name": "新入社員", "cost": 1, "power": 1, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "【登場時】1枚引く。"},
+    {"id": "Staff", "name": "担当社員", "cost": 3, "power": 4, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "新入社員から進化(1)。"},
+    {"id": "Chief", "name": "主任技術者", "cost": 5, "power": 8, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "担当社員から進化(1)。維持費0。"},
+    {"id": "Senior", "name": "教育係の先輩", "cost": 2, "power": 3, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "新入社員のパワー+3。"},
+    {"id": "Ace", "name": "現場のエース", "cost": 4, "power": 12, "type": "MACHINE", "category": "人材", "upkeep": 2, "desc": "高出力な現場員。"},
+    {"id": "Leader", "name": "現場代理人", "cost": 6, "power": 15, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "パワーが高いが低維持費。"},
+    {"id": "Expert", "name": "ベテラン職人", "cost": 5, "power": 10, "type": "MACHINE", "category": "人材", "upkeep": 2, "desc": "安定した計測値。"},
+    {"id": "Clerk", "name": "事務員", "cost": 2, "power": 1, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "毎ターンAP+1回復。"},
+    {"id": "Intern", "name": "実習生", "cost": 0, "power": 0, "type": "MACHINE", "category": "人材", "upkeep": 0, "desc": "コスト0の囮。"},
+    {"id": "SafetyOfficer", "name": "安全管理員", "cost": 3, "power": 2, "type": "MACHINE", "category": "人材", "upkeep": 1, "desc": "現場の守り神。"},
+    {"id": "LevelBasic", "name": "普通のレベル", "cost": 1, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "基本機材。"},
+    {"id": "LevelAuto", "name": "オートレベル", "cost": 3, "power": 6, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "普通レベルから進化(1)。"},
+    {"id": "StaffBasic", "name": "アルミスタッフ", "cost": 1, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "基本スタッフ。"},
+    {"id": "StaffRef", "name": "反射スタッフ", "cost": 3, "power": 7, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "アルミから進化(1)。"},
+    {"id": "TS", "name": "光波TS", "cost": 4, "power": 10, "type": "MACHINE", "category": "機材", "upkeep": 2, "desc": "主力機材。"},
+    {"id": "GNSS", "name": "GNSS衛星", "cost": 6, "power": 18, "type": "MACHINE", "category": "機材", "upkeep": 3, "desc": "晴天時パワー+5。"},
+    {"id": "Drone", "name": "UAVドローン", "cost": 5, "power": 14, "type": "MACHINE", "category": "機材", "upkeep": 2, "desc": "濃霧の影響を受けない。"},
+    {"id": "Scanner", "name": "3Dスキャナ", "cost": 8, "power": 25, "type": "MACHINE", "category": "機材", "upkeep": 3, "desc": "最高クラスの出力。"},
+    {"id": "UsedTS", "name": "中古のTS", "cost": 2, "power": 12, "type": "MACHINE", "category": "機材", "upkeep": 2, "desc": "安価だが維持費がかさむ。"},
+    {"id": "Laser", "name": "レーザー墨出し", "cost": 2, "power": 5, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "室内で真価を発揮。"},
+    {"id": "Compass", "name": "コンパス", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "方位を計測。"},
+    {"id": "Tripod", "name": "三脚", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "機材の土台。"},
+    {"id": "Caliper", "name": "ノギス", "cost": 1, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "精密計測。"},
+    {"id": "Scale", "name": "スケール", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "基本。"},
+    {"id": "Chalk", "name": "チョーク", "cost": 1, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "マーキング用。"},
+    {"id": "Excavator", "name": "バックホー", "cost": 7, "power": 20, "type": "MACHINE", "category": "機材", "upkeep": 4, "desc": "圧倒的パワー。"},
+    {"id": "Rental", "name": "レンタル重機", "cost": 3, "power": 15, "type": "MACHINE", "category": "機材", "upkeep": 5, "desc": "維持費が非常に高い。"},
+    {"id": "SmallTruck", "name": "軽トラ", "cost": 2, "power": 1, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "設置をスムーズにする。"},
+    {"id": "Concrete", "name": "生コン車", "cost": 5, "power": 10, "type": "MACHINE", "category": "機材", "upkeep": 3, "desc": "雨天時パワー-5。"},
+    {"id": "Pump", "name": "排水ポンプ", "cost": 3, "power": 0, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "豪雨のマイナスを無効化。"},
+    {"id": "GenSet", "name": "発電機", "cost": 3, "power": 3, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "他機材のパワー+2。"},
+    {"id": "Radio", "name": "無線機", "cost": 2, "power": 2, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "ドローンを強化。"},
+    {"id": "Lights", "name": "投光器", "cost": 3, "power": 4, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "後半でパワーアップ。"},
+    {"id": "Helmet", "name": "ヘルメット", "cost": 1, "power": 0, "type": "MACHINE", "category": "機材", "upkeep": 0, "desc": "人材コストを軽減。"},
+    {"id": "Barrier", "name": "工事看板", "cost": 2, "power": 0, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "相手の行動を抑制。"},
+    {"id": "Elite", "name": "少数精鋭", "cost": 2, "power": 0, "type": "SPELL", "desc": "最大AP-1。2枚引く。"},
+    {"id": "Decision", "name": "苦渋の決断", "cost": 0, "power": 0, "type": "SPELL", "desc": "手札から強カードを捨て最大AP+2。"},
+    {"id": "Fund", "name": "資金調達", "cost": 4, "power": 0, "type": "SPELL", "desc": "永久に最大AP+1。"},
+    {"id": "Transceiver", "name": "トランシーバー", "cost": 1, "power": 0, "type": "SPELL", "desc": "デッキから1枚引く。"},
+    {"id": "Safety", "name": "安全巡回", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手の最大AP-1。"},
+    {"id": "Lost", "name": "紛失事故", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手のパワー10以上を1台破壊。"},
+    {"id": "Note", "name": "電子野帳", "cost": 1, "power": 0, "type": "SPELL", "desc": "カードを2枚引く。"},
+    {"id": "Repair", "name": "緊急修理", "cost": 2, "power": 0, "type": "SPELL", "desc": "APを5回復する。"},
+    {"id": "Check", "name": "Wチェック", "cost": 2, "power": 0, "type": "SPELL", "desc": "カードを3枚引く。"},
+    {"id": "Bush", "name": "藪払い", "cost": 2, "power": 0, "type": "SPELL", "desc": "相手の低コスト機を破壊。"},
+    {"id": "Rush", "name": "突貫工事", "cost": 0, "power": 0, "type": "SPELL", "desc": "このターンAP+4。終了時、場の1台自壊。"},
+    {"id": "Consult", "name": "気象予報", "cost": 1, "power": 0, "type": "SPELL", "desc": "次ターンの天候を晴天にする。"},
+    {"id": "Training", "name": "資格手当", "cost": 2, "power": 0, "type": "SPELL", "desc": "社員1人のパワー+5、維持費0化。"},
+    {"id": "NightWork", "name": "徹夜作業", "cost": 0, "power": 0, "type": "SPELL", "desc": "AP全快。ただし手札を全て捨てる。"},
+    {"id": "Complaint", "name": "近隣クレーム", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手のAPを3削る。"},
+    {"id": "Boundary", "name": "境界未確定", "cost": 2, "power": 0, "type": "SPELL", "desc": "相手の機材1つを2ターン停止。"},
+    {"id": "Overtime", "name": "残業指示", "cost": 0, "power": 0, "type": "SPELL", "desc": "1枚引いてAP+2。"},
+    {"id": "Audit", "name": "会計検査", "cost": 4, "power": 0, "type": "SPELL", "desc": "相手の最大APを2削る。"},
+    {"id": "BlueprintLoss", "name": "図面紛失", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手の手札を見て1枚捨てさせる。"},
+    {"id": "DataTheft", "name": "データ盗用", "cost": 2, "power": 0, "type": "SPELL", "desc": "相手の手札をランダムに1枚捨てさせる。"},
+    {"id": "AllOrNothing", "name": "一か八か", "cost": 0, "power": 0, "type": "SPELL", "desc": "コイントス。表なら5枚引く、裏なら手札全捨て＋場の機材1つランダム破壊。"},
+    {"id": "Recycle", "name": "機材リサイクル", "cost": 2, "power": 0, "type": "SPELL", "desc": "破壊された機材1つを手札に戻す。"},
+    {"id": "SurveyPlan", "name": "測量計画", "cost": 1, "power": 0, "type": "SPELL", "desc": "山札から3枚見て1枚を山札の一番上、残りを山札の一番下に。"},
+    {"id": "EmergencyOrder", "name": "緊急発注", "cost": 3, "power": 0, "type": "SPELL", "desc": "デッキから機材を1枚サーチして手札に。"},
+    {"id": "Dispatch", "name": "人材派遣", "cost": 2, "power": 0, "type": "SPELL", "desc": "デッキから社員を1枚サーチして手札に。"},
+    {"id": "FullyPrepared", "name": "準備万端", "cost": 5, "power": 0, "type": "SPELL", "desc": "場に異なる5種類のカードがあれば使用可。山札から勝利カードをサーチ。"},
+    {"id": "SurveyDB", "name": "測量データベース", "cost": 4, "power": 3, "type": "MACHINE", "category": "機材", "upkeep": 1, "desc": "場にいる限り、毎ターン開始時に1枚引く。"},
+    {"id": "Demolition", "name": "解体工事", "cost": 4, "power": 0, "type": "SPELL", "desc": "相手の機材1つを破壊。"},
+    {"id": "Layoff", "name": "リストラ", "cost": 3, "power": 0, "type": "SPELL", "desc": "相手の人材1人を破壊。"},
+    {"id": "Restructure", "name": "人員整理", "cost": 5, "power": 0, "type": "SPELL", "desc": "相手の人材を最大2人まで破壊。"},
+    {"id": "Removal", "name": "設備撤去", "cost": 6, "power": 0, "type": "SPELL", "desc": "相手の機材を最大2つまで破壊。"},
+    {"id": "SiteFire", "name": "現場火災", "cost": 7, "power": 0, "type": "SPELL", "desc": "相手の場のカード全てを破壊。自分の最大AP-2。"},
+    {"id": "Rehire", "name": "再雇用", "cost": 2, "power": 0, "type": "SPELL", "desc": "墓地から人材1人を手札に。"},
+    {"id": "Salvage", "name": "サルベージ", "cost": 4, "power": 0, "type": "SPELL", "desc": "墓地から任意のカード1枚を手札に。"},
+    {"id": "Recovery", "name": "復旧作業", "cost": 5, "power": 0, "type": "SPELL", "desc": "墓地から最大2枚を手札に。"},
+    {"id": "DataRestore", "name": "記録復元", "cost": 3, "power": 0, "type": "SPELL", "desc": "墓地からスペルカードを手札に。"},
+    {"id": "Goal30", "name": "工期内完遂", "cost": 4, "power": 0, "type": "GOAL", "desc": "スコア30以上で勝利。"},
+    {"id": "GoalFinal", "name": "社長決裁", "cost": 10, "power": 0, "type": "GOAL", "desc": "スコア10以上で勝利。"},
+]
+
+EVOLUTION_MAP = {"Staff": "Newbie", "Chief": "Staff", "LevelAuto": "LevelBasic", "StaffRef": "StaffBasic"}
+
+CARD_INDEX = {c["id"]: c for c in CARD_DB}  # {card_id: カード定義}
+
+# CPU戦でCPUが使うデッキ（ultimate.html の selectDeckForBattle と同じ内容）
+CPU_DECK = (
+    "LevelBasic", "LevelBasic", "LevelBasic",
+    "LevelAuto", "LevelAuto", "LevelAuto",
+    "StaffBasic", "StaffBasic", "StaffBasic",
+    "StaffRef", "StaffRef", "StaffRef",
+    "TS", "TS", "TS", "TS",
+    "Drone", "Drone", "Drone",
+    "Laser", "Laser",
+    "GenSet", "GenSet",
+    "SmallTruck", "SmallTruck",
+    "Note", "Note", "Check", "Check",
+    "Repair", "Repair", "Overtime",
+    "Consult", "Consult",
+    "Lost", "Boundary",
+    "Goal30", "Goal30", "GoalFinal", "GoalFinal",
+)
+
+DECK_SIZE = 40  # デッキ枚数
+MAX_COPIES = 4  # 同名カードの上限（デッキ編集画面と同じ）
+DECK_CACHE_SIZE = 256  # プロトタイプデッキのLRU上限
+
+_deck_cache = OrderedDict()  # {fingerprint: (card, ...)} 検証済みプロトタイプデッキ
+_deck_cache_lock = threading.Lock()  # 別ルームのアクターから同時に呼ばれる
+
+
+def deck_fingerprint(card_ids):
+    """デッキの正規化キー（シャッフルするので並び順は無視）"""
+    return tuple(sorted(card_ids))
+
+
+def validate_deck(card_ids):
+    """デッキの問題点を返す（問題なければNone）"""
+    if not isinstance(card_ids, (list, tuple)) or len(card_ids) != DECK_SIZE:
+        return f"デッキは{DECK_SIZE}枚である必要があります"
+    counts = {}
+    for cid in card_ids:
+        if not isinstance(cid, str) or cid not in CARD_INDEX:
+            return f"不明なカードです: {cid}"
+        counts[cid] = counts.get(cid, 0) + 1
+        if counts[cid] > MAX_COPIES:
+            return f"{CARD_INDEX[cid]['name']}は{MAX_COPIES}枚までです"
+    return None
+
+
+def get_prototype_deck(card_ids):
+    """検証済みのプロトタイプデッキを返す（不正ならValueError）
+
+    同じデッキの再提出はフィンガープリントの辞書引きだけで済む。
+    """
+    if not isinstance(card_ids, (list, tuple)) or not all(isinstance(cid, str) for cid in card_ids):
+        raise ValueError("デッキの形式が不正です")
+    fp = deck_fingerprint(card_ids)
+    with _deck_cache_lock:
+        proto = _deck_cache.get(fp)
+        if proto is not None:
+            _deck_cache.move_to_end(fp)
+            return proto
+    error = validate_deck(fp)
+    if error:
+        raise ValueError(error)
+    # frozen属性を初期化したカードを事前に組み立てておく
+    proto = tuple(dict(CARD_INDEX[cid], frozen=0) for cid in fp)
+    with _deck_cache_lock:
+        _deck_cache[fp] = proto
+        if len(_deck_cache) > DECK_CACHE_SIZE:
+            _deck_cache.popitem(last=False)
+    return proto
+
+
+def clone_deck(proto, owner):
+    """プロトタイプからゲーム用のデッキを複製（カードの値はすべて不変型なので浅いコピーで十分）
+
+    各カードには試合中で一意なインスタンスID（uid）を振る。クライアントはこれを
+    キーにしてカードの要素を使い回す。
+    """
+    return [dict(c, uid=f"{owner}-{n}") for n, c in enumerate(proto)]
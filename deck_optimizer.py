@@ -0,0 +1,196 @@
+# -*- coding: utf-8 -*-
+"""デッキ探索ツール
+
+40枚・同名4枚までの制約を守りながら遺伝的アルゴリズムでデッキを探す。
+各候補はガントレット（既定はCPU戦のデッキ）とのバッチ対戦の勝率で評価し、
+評価はプロセスプールで並列に行う。適応度はデッキのフィンガープリントで
+メモ化するので、同じデッキが何度現れても2回目以降は計算しない。
+--cache のファイルには評価の条件（ガントレット・対戦数・シード）も書き、
+条件が違う実行ではキャッシュを使わない。
+
+    python deck_optimizer.py --generations 30 --population 64 --out best_deck.json
+"""
+
+import argparse
+import json
+import os
+import random
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from cards import CARD_DB, CPU_DECK, DECK_SIZE, MAX_COPIES, deck_fingerprint, validate_deck
+from simulator import simulate
+
+CARD_IDS = [c["id"] for c in CARD_DB]
+GOAL_IDS = [c["id"] for c in CARD_DB if c["type"] == "GOAL"]
+
+
+def evaluate(deck, gauntlet, games, seed):
+    """ガントレット全体に対する勝率（引き分けは0.5勝）"""
+    score = 0.0
+    for opponent in gauntlet:
+        result = simulate(deck, opponent, games=games, seed=seed)
+        score += (result["p1_wins"] + 0.5 * result["draws"]) / games
+    return score / len(gauntlet)
+
+
+def _counts(deck):
+    counts = {}
+    for cid in deck:
+        counts[cid] = counts.get(cid, 0) + 1
+    return counts
+
+
+def _fill(counts, rng):
+    """枚数制限を守ってランダムに40枚まで埋め、正規化したデッキを返す"""
+    total = sum(counts.values())
+    while total < DECK_SIZE:
+        cid = rng.choice(CARD_IDS)
+        if counts.get(cid, 0) < MAX_COPIES:
+            counts[cid] = counts.get(cid, 0) + 1
+            total += 1
+    return deck_fingerprint(cid for cid, n in counts.items() for _ in range(n))
+
+
+def random_deck(rng):
+    # 勝利カードが無いデッキは勝ちようがないので1枚ずつ入れておく
+    return _fill({cid: 1 for cid in GOAL_IDS}, rng)
+
+
+def mutate(deck, rng, swaps=2):
+    """数枚を別のカードに入れ替える"""
+    counts = _counts(deck)
+    for _ in range(swaps):
+        cid = rng.choice(deck)
+        if counts.get(cid, 0) > 0:
+            counts[cid] -= 1
+    return _fill(counts, rng)
+
+
+def crossover(a, b, rng):
+    """両親に共通するカードを残し、残りはどちらかの親から引き継ぐ"""
+    ca, cb = _counts(a), _counts(b)
+    counts = {cid: min(n, cb.get(cid, 0)) for cid, n in ca.items()}
+    rest = [cid for cid, n in ca.items() for _ in range(n - counts.get(cid, 0))]
+    rest += [cid for cid, n in cb.items() for _ in range(n - min(n, ca.get(cid, 0)))]
+    rng.shuffle(rest)
+    total = sum(counts.values())
+    for cid in rest:
+        if total >= DECK_SIZE:
+            break
+        if counts.get(cid, 0) < MAX_COPIES:
+            counts[cid] = counts.get(cid, 0) + 1
+            total += 1
+    return _fill(counts, rng)
+
+
+class DeckSearch:
+    """世代ごとに未評価の候補だけをプロセスプールで評価する"""
+
+    def __init__(self, gauntlet=(CPU_DECK,), games=512, seed=None, workers=None, cache_path=None):
+        self.gauntlet = tuple(tuple(d) for d in gauntlet)
+        self.games = games
+        self.workers = workers or os.cpu_count() or 1
+        self.cache_path = cache_path
+        self.fitness = {}  # {fingerprint: 勝率}
+        self.evaluated = 0
+        cache = None
+        if cache_path and os.path.exists(cache_path):
+            with open(cache_path, encoding="utf-8") as f:
+                cache = json.load(f)
+            if not isinstance(cache, dict):
+                cache = None  # 条件を記録していない古い形式は使わない
+        if seed is None and cache is not None and self._matches(cache, cache.get("seed")):
+            seed = cache["seed"]  # シード未指定なら前回と同じ乱数列で評価してキャッシュを活かす
+        self.seed = seed if seed is not None else random.randrange(2 ** 32)  # 全候補で同じ乱数列を使う
+        self.rng = random.Random(self.seed)  # 交叉・突然変異も記録したシードから再現できるようにする
+        if cache is not None and self._matches(cache, self.seed):
+            for entry in cache["entries"]:
+                self.fitness[deck_fingerprint(entry["cards"])] = entry["fitness"]
+
+    def conditions(self, seed):
+        """適応度の値を左右する評価の条件"""
+        return {"gauntlet": [list(deck_fingerprint(d)) for d in self.gauntlet], "games": self.games, "seed": seed}
+
+    def _matches(self, cache, seed):
+        return all(cache.get(key) == value for key, value in self.conditions(seed).items())
+
+    def score(self, pool, decks):
+        """デッキごとの勝率（キャッシュに無いものだけ評価）"""
+        todo = list(dict.fromkeys(d for d in decks if d not in self.fitness))
+        if todo:
+            n = len(todo)
+            results = pool.map(evaluate, todo, [self.gauntlet] * n, [self.games] * n, [self.seed] * n)
+            for deck, fit in zip(todo, results):
+                self.fitness[deck] = fit
+            self.evaluated += n
+        return [self.fitness[d] for d in decks]
+
+    def run(self, generations=30, population=64, elite=8, initial=(), log=print):
+        if generations < 1:
+            raise ValueError("generations は1以上にしてください")
+        rng = self.rng
+        decks = [deck_fingerprint(d) for d in initial if validate_deck(list(d)) is None]
+        decks += [random_deck(rng) for _ in range(population - len(decks))]
+        start = time.perf_counter()
+        with ProcessPoolExecutor(max_workers=self.workers) as pool:
+            for gen in range(generations):
+                scores = self.score(pool, decks)
+                ranked = [d for _, d in sorted(zip(scores, decks), key=lambda x: -x[0])]
+                best = ranked[0]
+                elapsed = time.perf_counter() - start
+                log(f"gen {gen + 1}: best {self.fitness[best]:.3f}  evaluated {self.evaluated}"
+                    f"  cached {len(self.fitness)}  ({self.evaluated / max(elapsed, 1e-9) * 3600:.0f} decks/h)")
+                # 上位を残し、上位半分からの交叉と突然変異で次世代を作る
+                parents = ranked[:max(2, population // 2)]
+                children = ranked[:elite]
+                while len(children) < population:
+                    a, b = rng.sample(parents, 2)
+                    children.append(mutate(crossover(a, b, rng), rng, swaps=rng.randint(1, 3)))
+                decks = children
+        self.save()
+        return best, self.fitness[best]
+
+    def save(self):
+        if not self.cache_path:
+            return
+        entries = [{"cards": list(d), "fitness": fit} for d, fit in self.fitness.items()]
+        with open(self.cache_path, "w", encoding="utf-8") as f:
+            json.dump(dict(self.conditions(self.seed), entries=entries), f, ensure_ascii=False)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ガントレットへの勝率でデッキを探索する")
+    parser.add_argument("--generations", type=int, default=30)
+    parser.add_argument("--population", type=int, default=64)
+    parser.add_argument("--elite", type=int, default=8)
+    parser.add_argument("--games", type=int, default=512, help="1候補・1対戦相手あたりの対戦数")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--seed", type=int, default=None)
+    parser.add_argument("--gauntlet", help="対戦相手デッキ（カードIDのリストのリスト）のJSONファイル")
+    parser.add_argument("--cache", help="適応度キャッシュのJSONファイル（実行をまたいで再利用）")
+    parser.add_argument("--out", help="最良デッキの書き出し先（デッキスロットと同じ形式）")
+    args = parser.parse_args()
+    if args.generations < 1:
+        parser.error("--generations は1以上にしてください")
+
+    gauntlet = (CPU_DECK,)
+    if args.gauntlet:
+        with open(args.gauntlet, encoding="utf-8") as f:
+            gauntlet = json.load(f)
+    for deck in gauntlet:
+        error = validate_deck(list(deck))
+        if error:
+            parser.error(f"ガントレットのデッキが不正です: {error}")
+
+    search = DeckSearch(gauntlet, games=args.games, seed=args.seed, workers=args.workers, cache_path=args.cache)
+    best, fit = search.run(args.generations, args.population, args.elite, initial=gauntlet)
+    print(f"best win rate {fit:.3f}")
+    print(json.dumps(list(best), ensure_ascii=False))
+    if args.out:
+        with open(args.out, "w", encoding="utf-8") as f:
+            json.dump({"name": f"探索デッキ ({fit:.0%})", "cards": list(best)}, f, ensure_ascii=False, indent=2)
+
+
+if __name__ == "__main__":
+    main()
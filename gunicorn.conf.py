@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+"""gunicorn設定
+
+    gunicorn -c gunicorn.conf.py app:app
+
+マスターでアプリを読み込み、不変データを構築してからワーカーをforkする。
+"""
+
+import gc
+import os
+
+bind = os.environ.get("BIND", "0.0.0.0:5000")
+# アプリと同じ ATAKAMOVS_ASYNC_MODE でワーカーの種類を決める（threadingなら1プロセスで複数スレッド）
+async_mode = os.environ.get("ATAKAMOVS_ASYNC_MODE") or "eventlet"
+# eventletワーカーはgunicorn 26で削除されたので requirements.txt で26未満に固定している
+worker_class = {"threading": "gthread", "gevent": "gevent"}.get(async_mode, "eventlet")
+threads = int(os.environ.get("GUNICORN_THREADS", "100"))  # gthreadのときだけ使われる
+# Socket.IOのルーム状態はプロセス内にあるので、複数ワーカーにする場合はスティッキーセッションが必要
+workers = int(os.environ.get("WEB_CONCURRENCY", "1"))
+preload_app = True
+
+# 設定ファイルはpreloadでアプリを読み込む前にimportされるので、ここで止めておけば
+# 読み込み中の世代別GCで共有したいページに書き込みが起きない（when_readyで再開する）
+gc.disable()
+
+
+def when_ready(server):
+    # preload済みのアプリでウォームアップしてからforkする（preloadしないならマスターではアプリを読み込まない）
+    if server.cfg.preload_app:
+        import app
+        app.warmup()
+    gc.enable()
+
+
+def post_worker_init(worker):
+    # preloadしない設定で起動された場合も、リクエストを受ける前にウォームアップする
+    import app
+    app.warmup()
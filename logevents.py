@@ -0,0 +1,179 @@
+# -*- coding: utf-8 -*-
+"""ゲームログのイベントコードと表示テンプレート
+
+ログは (コード, プレイヤーID, カードID, 数値などの引数...) のタプルで記録し、
+文章にするのはクライアント。テンプレートはページを描画するときに一度だけ埋め込む。
+
+テンプレートの {p} はプレイヤー（P1/P2）、{card} はカード名、{0} {1} ... は引数。
+{weather:1} のような {表の名前:i} は、i番目の引数（コード）を NAMES の表で文字列にする。
+コードは記録済みのログの意味を変えないよう、追加するときは末尾に足すこと。
+"""
+
+import re
+
+START = 0
+FIRST_PLAYER = 1
+DAY = 2
+SHAKAPACHI = 3
+TIMEOUT = 4
+TIMEOUT_SELECT = 5
+FORFEIT = 6
+
+# カードのプレイ
+PLAY = 10
+EVOLVE = 11
+SPELL_BANNED = 12
+RUSH_WARNING = 13
+NEXT_SUNNY = 14
+OPP_MAX_AP_1 = 15
+OPP_AP_3 = 16
+OPP_MAX_AP_2 = 17
+THEFT = 18
+COIN_WIN = 19
+COIN_LOSE = 20
+COIN_LOSE_DESTROY = 21
+VARIETY_SHORT = 22
+SITE_FIRE = 23
+SELF_MAX_AP_2 = 24
+WIN_FINAL = 25
+WIN_30 = 26
+
+# 選択の結果
+BUFF = 30
+DESTROY = 31
+FREEZE = 32
+SACRIFICE = 33
+UPKEEP_STILL_SHORT = 34
+RUSH_DESTROYED = 35
+DISCARD_ENEMY_HAND = 36
+RECYCLE = 37
+SURVEY = 38
+SEARCH = 39
+DESTROY_ENEMY = 40
+FIRE_ENEMY = 41
+REMOVE_ENEMY = 42
+REHIRE = 43
+RECOVER = 44
+RESTORE = 45
+
+# ターン開始
+THAW = 50
+SURVEY_DB_DRAW = 51
+
+# 選択の指示
+SELECT_BUFF = 60
+SELECT_LOST = 61
+SELECT_BUSH = 62
+SELECT_FREEZE = 63
+SELECT_ENEMY_HAND = 64
+SELECT_RECYCLE = 65
+SELECT_SURVEY = 66
+SELECT_SEARCH_MACHINE = 67
+SELECT_SEARCH_PERSONNEL = 68
+SELECT_SEARCH_GOAL = 69
+SELECT_DEMOLITION = 70
+SELECT_LAYOFF = 71
+SELECT_RESTRUCTURE = 72
+SELECT_REMOVAL = 73
+SELECT_REHIRE = 74
+SELECT_SALVAGE = 75
+SELECT_RECOVERY = 76
+SELECT_DATA_RESTORE = 77
+SELECT_RUSH = 78
+SELECT_UPKEEP = 79
+
+# 天候のコード（simulator.py の SUNNY/RAIN/FOG と同じ並び）
+WEATHERS = ("晴天", "豪雨", "濃霧")
+WEATHER_CODES = {name: code for code, name in enumerate(WEATHERS)}
+
+# {表の名前:i} で引くコードの表（テンプレートと一緒にページに埋め込む）
+NAMES = {"weather": WEATHERS}
+
+TEMPLATES = {
+    START: "観測吝VS ULTIMATE Ver 4.1 開始！",
+    FIRST_PLAYER: "先攻: {p}",
+    DAY: "--- Day {0} 天候: {weather:1} ---",
+    SHAKAPACHI: "{p}しゃかぱち{0}回目",
+    TIMEOUT: "{p}: 時間切れ",
+    TIMEOUT_SELECT: "{p}: 時間切れ（自動で選択）",
+    FORFEIT: "{p}: 時間切れが続いたため投了",
+
+    PLAY: "{p}: {card}",
+    EVOLVE: "{p}: {card} (進化召喚!)",
+    SPELL_BANNED: "{p}: スペル使用不可！(豪雨)",
+    RUSH_WARNING: "{p}: ターン終了時に1台破壊される",
+    NEXT_SUNNY: "{p}: 次ターンは晴天!",
+    OPP_MAX_AP_1: "{p}: 相手の最大AP-1",
+    OPP_AP_3: "{p}: 相手のAPを3削った!",
+    OPP_MAX_AP_2: "{p}: 相手の最大APを2削った!",
+    THEFT: "{p}: {card}を盗んで捨てた!",
+    COIN_WIN: "{p}: コイントス成功！5枚引いた!",
+    COIN_LOSE: "{p}: コイントス失敗！手札全捨て!",
+    COIN_LOSE_DESTROY: "{p}: コイントス失敗！手札全捨て＋{card}破壊!",
+    VARIETY_SHORT: "{p}: 場のカード種類が不足！({0}/5)",
+    SITE_FIRE: "{p}: 現場火災で相手の場を全滅させた！（{0}枚破壊）",
+    SELF_MAX_AP_2: "{p}: 自分の最大AP-2",
+    WIN_FINAL: "{p}: 社長決裁で勝利!",
+    WIN_30: "{p}: 工期完遂で勝利!",
+
+    BUFF: "{p}: {card}を強化!",
+    DESTROY: "{p}: {card}を破壊!",
+    FREEZE: "{p}: {card}を2ターン停止!",
+    SACRIFICE: "{p}: {card}を破棄",
+    UPKEEP_STILL_SHORT: "{p}: まだ維持費不足！さらに破棄",
+    RUSH_DESTROYED: "{p}: 突貫工事の反動で{card}が破壊",
+    DISCARD_ENEMY_HAND: "{p}: 相手の{card}を捨てさせた!",
+    RECYCLE: "{p}: {card}を墓地から回収!",
+    SURVEY: "{p}: 山札を整理した!",
+    SEARCH: "{p}: {card}をサーチ!",
+    DESTROY_ENEMY: "{p}: 相手の{card}を破壊!",
+    FIRE_ENEMY: "{p}: 相手の{card}を解雇!",
+    REMOVE_ENEMY: "{p}: 相手の{card}を撤去!",
+    REHIRE: "{p}: {card}を再雇用!",
+    RECOVER: "{p}: {card}を回収!",
+    RESTORE: "{p}: {card}を復元!",
+
+    THAW: "{p}: {card}が復帰!",
+    SURVEY_DB_DRAW: "{p}: 測量データベースで追加ドロー!",
+
+    SELECT_BUFF: "{p}: 強化する人材を選んでください",
+    SELECT_LOST: "{p}: 紛失させる機材を選んでください",
+    SELECT_BUSH: "{p}: 破壊する機材を選んでください",
+    SELECT_FREEZE: "{p}: 停止する機材を選んでください",
+    SELECT_ENEMY_HAND: "{p}: 相手の手札を見て1枚選んでください",
+    SELECT_RECYCLE: "{p}: 墓地から機材を1つ選んでください",
+    SELECT_SURVEY: "{p}: 山札の上3枚から1枚選んでください",
+    SELECT_SEARCH_MACHINE: "{p}: デッキから機材を1枚選んでください",
+    SELECT_SEARCH_PERSONNEL: "{p}: デッキから人材を1枚選んでください",
+    SELECT_SEARCH_GOAL: "{p}: デッキから勝利カードを1枚選んでください",
+    SELECT_DEMOLITION: "{p}: 破壊する相手の機材を選んでください",
+    SELECT_LAYOFF: "{p}: 破壊する相手の人材を選んでください",
+    SELECT_RESTRUCTURE: "{p}: 破壊する人材を選んでください（最大2人）",
+    SELECT_REMOVAL: "{p}: 破壊する機材を選んでください（最大2つ）",
+    SELECT_REHIRE: "{p}: 回収する人材を選んでください",
+    SELECT_SALVAGE: "{p}: 回収するカードを選んでください",
+    SELECT_RECOVERY: "{p}: 回収するカードを選んでください（最大2枚）",
+    SELECT_DATA_RESTORE: "{p}: 回収するスペルを選んでください",
+    SELECT_RUSH: "{p}: 突貫工事の反動！破壊するカードを選んでください",
+    SELECT_UPKEEP: "{p}: 維持費不足！破棄するカードを選んでください",
+}
+
+
+_PLACEHOLDER = re.compile(r"\{(\w+)(?::(\d+))?\}")
+
+
+def format_event(event, card_names):
+    """サーバー側で文章が必要なとき（デバッグやログ解析）用。クライアントと同じ規則で展開する"""
+    code, pid, card_id, *args = event
+
+    def value(m):
+        key, index = m.groups()
+        if index is not None:
+            return NAMES[key][args[int(index)]]
+        if key == "p":
+            return pid.upper() if pid else ""
+        if key == "card":
+            return card_names.get(card_id, card_id or "")
+        return str(args[int(key)])
+
+    return _PLACEHOLDER.sub(value, TEMPLATES[code])
@@ -0,0 +1,121 @@
+# -*- coding: utf-8 -*-
+"""クライアントごとの送信キュー（状態更新は最新のみ送る）
+
+update_ui は毎回スナップショット全体なので、古いものを送っても意味がない。
+クライアントごとに未確認（ack待ち）の状態更新は最大1つとし、その間に来た更新は
+「送るべき状態がある」という印だけ残して、ackが返った時点の最新状態を作って送る。
+クライアント1つあたりのメモリは状態の数に関係なく一定になる。
+
+room_ready や opponent_shakapachi のような一度きりのイベントはまとめずにすぐ送る。
+
+ackはソケットのスレッドで届くので、状態の組み立ては defer でルームのアクターに回す。
+ACK_TIMEOUT 秒たってもackが来なければ、schedule のタイマーでackが来たものとして扱い、
+その間に溜まった最新の状態を送る（ルームにそれ以上の更新がなくても最後の状態が届く）。
+"""
+
+import threading
+import time
+
+ACK_TIMEOUT = 5.0  # ackが返らないクライアント（古いページなど）を待つ最大秒数
+
+
+def _call_now(room_id, fn, *args):
+    fn(*args)
+
+
+class _Client:
+    __slots__ = ("inflight_since", "pending_room", "sent")
+
+    def __init__(self):
+        self.inflight_since = None  # ack待ちの状態更新を送った時刻
+        self.pending_room = None  # ack後に送るべき状態のルームID
+        self.sent = 0  # 送った状態更新の数（タイムアウトがどの送信のものか見分ける）
+
+
+class OutboundQueue:
+    def __init__(self, socketio, build_state, room_sids, defer=None, schedule=None):
+        self.socketio = socketio
+        self.build_state = build_state  # room_id -> update_ui のペイロード（なければNone）
+        self.room_sids = room_sids  # room_id -> そのルームのクライアントのsid
+        self.defer = defer or _call_now  # (room_id, fn, *args) -> ルームの処理順で fn(*args) を実行
+        self.schedule = schedule  # (delay, fn, *args) -> delay秒後に fn(*args)（なければ次の send_state で判定）
+        self.clients = {}  # {sid: _Client}
+        self.lock = threading.Lock()
+        self.stats = {"states_sent": 0, "states_coalesced": 0, "events_sent": 0, "ack_timeouts": 0}
+
+    def send_state(self, room_id):
+        """ルームの全クライアントに最新の状態を送る（ack待ちのクライアントには後で送る）"""
+        now = time.monotonic()
+        ready = []
+        with self.lock:
+            for sid in self.room_sids(room_id):
+                client = self.clients.setdefault(sid, _Client())
+                if client.inflight_since is not None and now - client.inflight_since < ACK_TIMEOUT:
+                    if client.pending_room is not None:
+                        self.stats["states_coalesced"] += 1
+                    client.pending_room = room_id
+                    continue
+                if client.inflight_since is not None:
+                    self.stats["ack_timeouts"] += 1
+                client.inflight_since = now
+                client.pending_room = None
+                ready.append(sid)
+        if ready:
+            payload = self.build_state(room_id)
+            if payload is None:
+                return
+            for sid in ready:
+                self._emit_state(sid, payload)
+
+    def send_event(self, sid, event, data):
+        """一度きりのイベントはまとめずにそのまま送る"""
+        self.stats["events_sent"] += 1
+        self.socketio.emit(event, data, to=sid)
+
+    def ack(self, sid, sent=None):
+        """クライアントが状態更新を受け取った（sent を渡したときはその送信のタイムアウト）"""
+        with self.lock:
+            client = self.clients.get(sid)
+            if client is None:
+                return
+            if sent is not None:
+                if client.sent != sent or client.inflight_since is None:
+                    return  # ackが来たか、その後に送り直している
+                self.stats["ack_timeouts"] += 1
+            room_id, client.pending_room = client.pending_room, None
+            client.inflight_since = time.monotonic() if room_id is not None else None
+        if room_id is not None:
+            self.defer(room_id, self._resend, sid, room_id)
+
+    def drop(self, sid):
+        """切断したクライアントの状態を捨てる"""
+        with self.lock:
+            self.clients.pop(sid, None)
+
+    def metrics(self):
+        with self.lock:
+            inflight = sum(1 for c in self.clients.values() if c.inflight_since is not None)
+            pending = sum(1 for c in self.clients.values() if c.pending_room is not None)
+            return dict(self.stats, clients=len(self.clients), inflight=inflight, pending=pending)
+
+    def _resend(self, sid, room_id):
+        payload = self.build_state(room_id)
+        if payload is None:
+            with self.lock:
+                client = self.clients.get(sid)
+                if client is not None:
+                    client.inflight_since = None
+            return
+        self._emit_state(sid, payload)
+
+    def _emit_state(self, sid, payload):
+        with self.lock:
+            self.stats["states_sent"] += 1
+            client = self.clients.get(sid)
+            sent = None
+            if client is not None:
+                client.sent += 1
+                sent = client.sent
+        if self.schedule is not None and sent is not None:
+            self.schedule(ACK_TIMEOUT, self.ack, sid, sent)
+        self.socketio.emit('update_ui', payload, to=sid, callback=lambda *args: self.ack(sid))
@@ -0,0 +1,164 @@
+# -*- coding: utf-8 -*-
+"""ライブのハンドラを対象にしたオンデマンドのプロファイリング
+
+管理者が期間（と任意でルームID・イベント）を指定して計測を開始すると、
+対象ハンドラの呼び出しごとに cProfile を取り、イベントごとに集計する。
+期間が終わるか停止されると PROFILE_DIR に pstats 形式（.prof）で書き出す。
+snakeviz や flameprof でそのまま開ける。
+
+プロファイラは同時に1つしか有効にできない（Python 3.12以降は2つ目の enable() が例外になる）ので、
+別のルームの呼び出しを計測している間に来た呼び出しは計測せずにそのまま実行する。
+
+計測していない間は、ハンドラごとにグローバル変数を1回見るだけのコストしかかからない。
+"""
+
+import cProfile
+import functools
+import os
+import pstats
+import threading
+import time
+
+PROFILE_DIR = os.environ.get("ATAKAMOVS_PROFILE_DIR", "profiles")
+MAX_WINDOW = 600  # 1回の計測の最大秒数
+
+_session = None  # 計測中だけ設定される（ホットパスはこれがNoneかどうかだけを見る）
+_lock = threading.Lock()
+_capture = threading.Lock()  # 有効にしているプロファイラは1つだけ
+_events = set()  # profiled で登録されたイベント名
+
+
+def start(seconds=60, room_id=None, events=None, schedule=None):
+    """計測を開始する（計測中なら先に書き出してから差し替える）
+
+    schedule(delay, fn, *args) を渡すと、期間が終わったときにそれで書き出しを行う。
+    room_id や events の形式が正しくなければ ValueError。
+    """
+    global _session
+    seconds = max(1, min(int(seconds), MAX_WINDOW))
+    if room_id is not None and not isinstance(room_id, str):
+        raise ValueError("room_id must be a string")
+    if events is not None:
+        if not isinstance(events, list) or not all(isinstance(e, str) for e in events):
+            raise ValueError("events must be a list of event names")
+        unknown = set(events) - _events
+        if unknown:
+            raise ValueError(f"unknown events: {', '.join(sorted(unknown))}")
+    stop()
+    session = {
+        "started": time.time(),
+        "until": time.monotonic() + seconds,
+        "room_id": room_id,
+        "events": set(events) if events else None,
+        "stats": {},  # {event: pstats.Stats}
+        "calls": {},  # {event: 呼び出し回数}
+        "skipped": 0,  # 別の計測中だったので計測しなかった呼び出し
+    }
+    with _lock:
+        _session = session
+    if schedule is not None:
+        schedule(seconds, _expire, session)
+    return status()
+
+
+def stop():
+    """計測を終了して書き出したファイルのパスを返す"""
+    global _session
+    with _lock:
+        session, _session = _session, None
+    if session is None:
+        return []
+    return _dump(session)
+
+
+def _expire(session):
+    """期間が終わった計測を書き出す（その後に差し替えられていれば何もしない）"""
+    global _session
+    with _lock:
+        if _session is not session:
+            return
+        _session = None
+    _dump(session)
+
+
+def status():
+    """計測の状態（期間切れなら書き出しも行う）"""
+    session = _session
+    if session is not None and time.monotonic() >= session["until"]:
+        return {"active": False, "written": stop()}
+    if session is None:
+        return {"active": False}
+    return {
+        "active": True,
+        "remaining": round(session["until"] - time.monotonic(), 1),
+        "room_id": session["room_id"],
+        "events": sorted(session["events"]) if session["events"] else None,
+        "calls": dict(session["calls"]),
+        "skipped": session["skipped"],
+    }
+
+
+def _dump(session):
+    if not session["stats"]:
+        return []
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    stamp = time.strftime("%Y%m%d-%H%M%S", time.localtime(session["started"]))
+    suffix = f"-room{session['room_id']}" if session["room_id"] else ""
+    paths = []
+    for event, stats in session["stats"].items():
+        path = os.path.join(PROFILE_DIR, f"{stamp}-{event}{suffix}.prof")
+        stats.dump_stats(path)
+        paths.append(path)
+    return paths
+
+
+def _record(session, event, prof):
+    with _lock:
+        if event in session["stats"]:
+            session["stats"][event].add(prof)
+        else:
+            session["stats"][event] = pstats.Stats(prof)
+        session["calls"][event] = session["calls"].get(event, 0) + 1
+
+
+def profiled(event, room_of):
+    """ハンドラを計測対象にするデコレーター
+
+    room_of はハンドラと同じ引数を受け取ってルームIDを返す関数（ルーム指定の計測のときだけ呼ばれる）。
+    """
+    _events.add(event)
+
+    def decorator(fn):
+        @functools.wraps(fn)
+        def wrapper(*args, **kwargs):
+            session = _session
+            if session is None:
+                return fn(*args, **kwargs)
+            if time.monotonic() >= session["until"]:
+                return fn(*args, **kwargs)  # 書き出しは期限のタイマー（か次の status）で行う
+            if session["events"] and event not in session["events"]:
+                return fn(*args, **kwargs)
+            if session["room_id"] and room_of(*args, **kwargs) != session["room_id"]:
+                return fn(*args, **kwargs)
+            if not _capture.acquire(blocking=False):
+                with _lock:
+                    session["skipped"] += 1
+                return fn(*args, **kwargs)
+            try:
+                prof = cProfile.Profile()
+                try:
+                    prof.enable()
+                except ValueError:
+                    # 外部のプロファイラが動いている
+                    with _lock:
+                        session["skipped"] += 1
+                    return fn(*args, **kwargs)
+                try:
+                    return fn(*args, **kwargs)
+                finally:
+                    prof.disable()
+                    _record(session, event, prof)
+            finally:
+                _capture.release()
+        return wrapper
+    return decorator
@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+"""イベントごとのトークンバケットによる流量制限
+
+ハンドラにデコレーターで付けると、ゲームの処理に入る前に sid 単位・ルーム単位の
+バケットを確認し、トークンが無ければ何もせずに捨てる（捨てた数は集計する）。
+"""
+
+import functools
+import threading
+import time
+
+PRUNE_EVERY = 1024  # この回数ごとに満タンのバケット（無いのと同じ）を掃除する
+
+
+class RateLimiter:
+    def __init__(self, limits):
+        # {event: {"sid": (毎秒の補充量, 上限), "room": (...)}}
+        self.limits = limits
+        self.buckets = {}  # {(scope, key): {event: [tokens, 最終更新時刻]}}
+        self.throttled = {}  # {event: 捨てた回数}
+        self.lock = threading.Lock()
+        self.calls = 0
+
+    def allow(self, event, scope, key):
+        rate, burst = self.limits[event][scope]
+        now = time.monotonic()
+        with self.lock:
+            self.calls += 1
+            if self.calls % PRUNE_EVERY == 0:
+                self._prune(now)
+            per_key = self.buckets.setdefault((scope, key), {})
+            bucket = per_key.get(event)
+            if bucket is None:
+                per_key[event] = [burst - 1, now]
+                return True
+            tokens = min(burst, bucket[0] + (now - bucket[1]) * rate)
+            bucket[1] = now
+            if tokens < 1:
+                bucket[0] = tokens
+                self.throttled[event] = self.throttled.get(event, 0) + 1
+                return False
+            bucket[0] = tokens - 1
+            return True
+
+    def limit(self, event, sid_of, room_of):
+        """ハンドラに流量制限をかけるデコレーター（設定の無いスコープは見ない）"""
+        scopes = self.limits[event]
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            def wrapper(*args, **kwargs):
+                if "sid" in scopes and not self.allow(event, "sid", sid_of()):
+                    return None
+                if "room" in scopes:
+                    room_id = room_of()
+                    if room_id is not None and not self.allow(event, "room", room_id):
+                        return None
+                return fn(*args, **kwargs)
+            return wrapper
+        return decorator
+
+    def drop(self, scope, key):
+        """切断したクライアントなどのバケットを捨てる"""
+        with self.lock:
+            self.buckets.pop((scope, key), None)
+
+    def metrics(self):
+        with self.lock:
+            return {"buckets": len(self.buckets), "throttled": dict(self.throttled)}
+
+    def _prune(self, now):
+        for key in list(self.buckets):
+            per_key = self.buckets[key]
+            for event in list(per_key):
+                rate, burst = self.limits[event][key[0]]
+                tokens, updated = per_key[event]
+                if tokens + (now - updated) * rate >= burst:
+                    del per_key[event]
+            if not per_key:
+                del self.buckets[key]
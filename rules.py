@@ -0,0 +1,64 @@
+# -*- coding: utf-8 -*-
+"""合法手の生成
+
+手札ごとの実コストと使用可否、選択待ちの対象をまとめて計算する。
+状態が変わるたびにサーバーから送るので、1回の計算で場を1度だけ走査する。
+"""
+
+from cards import EVOLUTION_MAP
+
+
+def _field_summary(p):
+    """場の最初の位置（進化元の探索用）とヘルメット枚数"""
+    first_index = {}
+    helmets = 0
+    for i, f in enumerate(p["field"]):
+        first_index.setdefault(f["id"], i)
+        if f["id"] == "Helmet":
+            helmets += 1
+    return first_index, helmets
+
+
+def _play_cost(card, first_index, helmets):
+    cost = card["cost"]
+    evolve_target_idx = -1
+    # 進化元が場にあればコスト1で進化
+    base_id = EVOLUTION_MAP.get(card["id"])
+    if base_id is not None and base_id in first_index:
+        cost, evolve_target_idx = 1, first_index[base_id]
+    # ヘルメット効果：人材のコスト-1
+    if card.get("category") == "人材":
+        cost = max(0, cost - helmets)
+    return cost, evolve_target_idx
+
+
+def effective_play_cost(p, card):
+    """カードの実コストと進化先のインデックス（進化しないなら-1）"""
+    first_index, helmets = _field_summary(p)
+    return _play_cost(card, first_index, helmets)
+
+
+def legal_actions(game, pid):
+    """pidが今取れる行動
+
+    costs/playable は手札と同じ並び。targets は選択待ちの対象インデックス。
+    """
+    p = game.players[pid]
+    sel = game.pending_selection
+    can_act = pid == game.turn and not game.winner and not sel
+    spell_banned = game.weather == "豪雨"  # 豪雨時はスペルカード使用禁止
+
+    first_index, helmets = _field_summary(p)
+    costs = []
+    playable = []
+    for card in p["hand"]:
+        cost, _ = _play_cost(card, first_index, helmets)
+        costs.append(cost)
+        playable.append(can_act and p["ap"] >= cost and not (spell_banned and card["type"] == "SPELL"))
+
+    return {
+        "costs": costs,
+        "playable": playable,
+        "targets": list(sel["targets"]) if sel and sel["player"] == pid else [],
+        "can_end_turn": can_act,
+    }
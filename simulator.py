@@ -0,0 +1,538 @@
+# -*- coding: utf-8 -*-
+"""NumPy配列によるロックステップ対戦シミュレーター
+
+数千ゲームをまとめて配列で持ち、全ゲームを1手ずつ同時に進める。
+各ステップで手番プレイヤーは「勝てるゴールがあれば出す、なければ実コストが
+一番低い合法手を出す、出せなければターン終了」という貪欲方針で動く。
+
+ドロー・AP系の単純なスペル、スコア計算、ターン開始時の維持費・事務員の
+AP計算はベクトル化している。対象選択が必要なカードと維持費不足時の破棄は、
+該当するゲームだけ1ゲームずつ処理する（対象は方針に従って自動で選ぶ）。
+
+    python simulator.py --games 4096
+"""
+
+import argparse
+import time
+
+import numpy as np
+
+from cards import CARD_DB, CPU_DECK, DECK_SIZE, EVOLUTION_MAP
+
+# --- カードID <-> 配列インデックス ---
+CARD_IDS = [c["id"] for c in CARD_DB]
+CID = {cid: i for i, cid in enumerate(CARD_IDS)}
+NC = len(CARD_IDS)
+
+COST = np.array([c["cost"] for c in CARD_DB], dtype=np.int16)
+POWER = np.array([c["power"] for c in CARD_DB], dtype=np.int16)
+UPKEEP = np.array([c.get("upkeep", 0) for c in CARD_DB], dtype=np.int16)
+IS_MACHINE = np.array([c["type"] == "MACHINE" for c in CARD_DB])
+IS_SPELL = np.array([c["type"] == "SPELL" for c in CARD_DB])
+IS_GOAL = np.array([c["type"] == "GOAL" for c in CARD_DB])
+IS_PERSONNEL = np.array([c.get("category") == "人材" for c in CARD_DB])
+IS_EQUIPMENT = np.array([c.get("category") == "機材" for c in CARD_DB])
+EVO_BASE = np.array([CID[EVOLUTION_MAP[cid]] if cid in EVOLUTION_MAP else -1 for cid in CARD_IDS], dtype=np.int16)
+
+# 天候（app.py の文字列と対応）
+SUNNY, RAIN, FOG = 0, 1, 2
+WEATHER_NAMES = ("晴天", "豪雨", "濃霧")
+WEATHER_ROLL = np.array([SUNNY, SUNNY, RAIN, FOG], dtype=np.int8)
+
+MAX_AP = 15
+HAND_SIZE = 5
+ZONE = DECK_SIZE  # 各ゾーンの最大枚数（自分のカードは40枚しかない）
+EMPTY = -1
+
+# ベクトル化するスペルの効果表
+DRAW_N = np.zeros(NC, dtype=np.int8)
+for _cid, _n in {"Newbie": 1, "Elite": 2, "Note": 2, "Check": 3, "Transceiver": 1, "Overtime": 1}.items():
+    DRAW_N[CID[_cid]] = _n
+AP_GAIN = np.zeros(NC, dtype=np.int16)  # min(最大AP, AP+n)
+for _cid, _n in {"Repair": 5, "Rush": 4, "Overtime": 2}.items():
+    AP_GAIN[CID[_cid]] = _n
+MAX_AP_DELTA = np.zeros(NC, dtype=np.int16)  # 最大APの増減（下限1）
+for _cid, _n in {"Elite": -1, "Fund": 1, "Decision": 2}.items():
+    MAX_AP_DELTA[CID[_cid]] = _n
+OPP_MAX_AP_DELTA = np.zeros(NC, dtype=np.int16)  # 相手の最大AP（下限1）
+for _cid, _n in {"Safety": -1, "Audit": -2}.items():
+    OPP_MAX_AP_DELTA[CID[_cid]] = _n
+OPP_AP_DELTA = np.zeros(NC, dtype=np.int16)  # 相手のAP（下限0）
+OPP_AP_DELTA[CID["Complaint"]] = -3
+
+# 相手の場を破壊するスペル（対象は条件に合う一番パワーの高いカード）: (条件, 枚数)
+DESTROY_SPELLS = {
+    "Lost": (lambda fid, power: power >= 10, 1),
+    "Bush": (lambda fid, power: COST[fid] <= 2, 1),
+    "Demolition": (lambda fid, power: IS_EQUIPMENT[fid], 1),
+    "Layoff": (lambda fid, power: IS_PERSONNEL[fid], 1),
+    "Restructure": (lambda fid, power: IS_PERSONNEL[fid], 2),
+    "Removal": (lambda fid, power: IS_EQUIPMENT[fid], 2),
+}
+
+# 対象選択などがあり1ゲームずつ処理するカード
+SCALAR_CARDS = np.zeros(NC, dtype=bool)
+for _cid in ("Training", "BlueprintLoss", "AllOrNothing", "Recycle", "SurveyPlan", "EmergencyOrder",
+             "Dispatch", "FullyPrepared", "SiteFire", "Rehire", "Salvage", "Recovery", "DataRestore"):
+    SCALAR_CARDS[CID[_cid]] = True
+
+NEWBIE, SENIOR, GENSET, RADIO, DRONE = CID["Newbie"], CID["Senior"], CID["GenSet"], CID["Radio"], CID["Drone"]
+LIGHTS, GNSS, CONCRETE, PUMP = CID["Lights"], CID["GNSS"], CID["Concrete"], CID["Pump"]
+CLERK, HELMET, SURVEY_DB = CID["Clerk"], CID["Helmet"], CID["SurveyDB"]
+RUSH, NIGHT_WORK, CONSULT, DATA_THEFT = CID["Rush"], CID["NightWork"], CID["Consult"], CID["DataTheft"]
+BOUNDARY = CID["Boundary"]
+GOAL30, GOAL_FINAL = CID["Goal30"], CID["GoalFinal"]
+
+
+def encode_deck(card_ids):
+    """カードIDのリストを配列インデックスに変換"""
+    return np.array([CID[cid] for cid in card_ids], dtype=np.int16)
+
+
+def _remove_at(arrays, rows, seats, idx):
+    """各ゲームのゾーンから idx 番目を取り除いて左に詰める（arraysは同じ形の配列のリスト）"""
+    j = np.arange(ZONE)
+    src = j + (j >= idx[:, None])  # idx以降は1つ右から持ってくる
+    for arr, fill in arrays:
+        sub = arr[rows, seats]
+        padded = np.concatenate([sub, np.full((len(rows), 1), fill, dtype=arr.dtype)], axis=1)
+        arr[rows, seats] = np.take_along_axis(padded, src, axis=1)
+
+
+class BatchGame:
+    """G ゲーム分の状態（プレイヤーは座席 0=p1, 1=p2）"""
+
+    def __init__(self, deck_p1, deck_p2, games=1024, seed=None):
+        self.rng = np.random.default_rng(seed)
+        g = self.games = games
+        self.ap = np.full((g, 2), 2, dtype=np.int16)
+        self.max_ap = np.full((g, 2), 2, dtype=np.int16)
+        self.score = np.zeros((g, 2), dtype=np.int16)
+        self.rush_used = np.zeros((g, 2), dtype=bool)
+
+        self.hand = np.full((g, 2, ZONE), EMPTY, dtype=np.int16)
+        self.hand_len = np.zeros((g, 2), dtype=np.int16)
+        # 場：カード、停止カウンター、資格手当のパワー加算と維持費0化
+        self.field = np.full((g, 2, ZONE), EMPTY, dtype=np.int16)
+        self.frozen = np.zeros((g, 2, ZONE), dtype=np.int8)
+        self.bonus = np.zeros((g, 2, ZONE), dtype=np.int16)
+        self.no_upkeep = np.zeros((g, 2, ZONE), dtype=bool)
+        self.field_len = np.zeros((g, 2), dtype=np.int16)
+        self.grave = np.full((g, 2, ZONE), EMPTY, dtype=np.int16)
+        self.grave_len = np.zeros((g, 2), dtype=np.int16)
+        # 山札は deck[pos:end] が残り（先頭が一番上）
+        self.deck = np.empty((g, 2, ZONE), dtype=np.int16)
+        self.deck_pos = np.zeros((g, 2), dtype=np.int16)
+        self.deck_end = np.full((g, 2), DECK_SIZE, dtype=np.int16)
+
+        self.weather = np.full(g, SUNNY, dtype=np.int8)
+        self.next_weather = np.full(g, EMPTY, dtype=np.int8)
+        self.turn_count = np.ones(g, dtype=np.int16)
+        self.winner = np.full(g, EMPTY, dtype=np.int8)
+        self.steps = 0
+        self.turns = 0  # 全ゲーム合計の経過ターン数
+
+        # デッキをシャッフルして配る（先攻はランダム）
+        for seat, deck in enumerate((encode_deck(deck_p1), encode_deck(deck_p2))):
+            self.deck[:, seat] = self.rng.permuted(np.broadcast_to(deck, (g, DECK_SIZE)), axis=1)
+        self.turn = self.rng.integers(0, 2, size=g, dtype=np.int8)
+        everyone = np.arange(g)
+        for seat in (0, 1):
+            self._draw(everyone, np.full(g, seat), HAND_SIZE)
+
+    # --- 共通処理 ---
+
+    def _draw(self, rows, seats, n=1):
+        for _ in range(n):
+            ok = self.deck_pos[rows, seats] < self.deck_end[rows, seats]
+            r, s = rows[ok], seats[ok]
+            self.hand[r, s, self.hand_len[r, s]] = self.deck[r, s, self.deck_pos[r, s]]
+            self.hand_len[r, s] += 1
+            self.deck_pos[r, s] += 1
+
+    def _field_counts(self, rows, seats):
+        """各ゲームの指定座席の場にある枚数（カードIDごと）"""
+        k = len(rows)
+        f = self.field[rows, seats, :int(self.field_len[rows, seats].max(initial=0))]
+        keys = (np.arange(k)[:, None] * (NC + 1) + f + 1).ravel()
+        return np.bincount(keys, minlength=k * (NC + 1)).reshape(k, NC + 1)[:, 1:]
+
+    def effective_costs(self, rows):
+        """手番プレイヤーの手札ごとの実コスト（rules.effective_play_cost と同じ計算）"""
+        seats = self.turn[rows]
+        hand = self.hand[rows, seats, :max(1, int(self.hand_len[rows, seats].max(initial=0)))]
+        h = np.where(hand >= 0, hand, 0)
+        counts = self._field_counts(rows, seats)
+        cost = COST[h]
+        base = EVO_BASE[h]
+        evolves = (base >= 0) & (np.take_along_axis(counts, np.where(base >= 0, base, 0), axis=1) > 0)
+        cost = np.where(evolves, np.int16(1), cost)
+        cost = np.where(IS_PERSONNEL[h], np.maximum(0, cost - counts[:, HELMET][:, None]), cost)
+        return cost, evolves
+
+    def recalc_scores(self, rows=None):
+        """app.recalc_scores のベクトル版（rowsを指定するとそのゲームだけ）"""
+        if rows is None:
+            rows = np.arange(self.games)
+        width = int(self.field_len[rows].max(initial=0))  # 場の最大枚数の列だけ計算する
+        f = self.field[rows, :, :width]
+        valid = f >= 0
+        fid = np.where(valid, f, 0)
+        present = lambda cid: (f == cid).any(axis=2, keepdims=True)
+        v = POWER[fid] + self.bonus[rows, :, :width]
+        v += np.int16(3) * (present(SENIOR) & (fid == NEWBIE))
+        v += np.int16(2) * (present(GENSET) & (fid != GENSET) & IS_MACHINE[fid])
+        v += np.int16(3) * (present(RADIO) & (fid == DRONE))
+        v += np.int16(4) * ((fid == LIGHTS) & (self.turn_count[rows] >= 6)[:, None, None])
+        weather = self.weather[rows, None, None]
+        v += np.int16(5) * ((fid == GNSS) & (weather == SUNNY))
+        v = np.where((weather == FOG) & (fid != DRONE), v // 2, v)
+        v -= np.int16(5) * ((weather == RAIN) & (fid == CONCRETE) & ~present(PUMP))
+        v = np.where(valid & (self.frozen[rows, :, :width] <= 0), np.maximum(0, v), 0)
+        self.score[rows] = v.sum(axis=2, dtype=np.int16)
+
+    # --- 1ステップ ---
+
+    def step(self):
+        """進行中の全ゲームで、手番プレイヤーが1手（カード1枚かターン終了）指す"""
+        act = np.flatnonzero(self.winner < 0)
+        if not len(act):
+            return False
+        seat = self.turn[act]
+        cost, evolves = self.effective_costs(act)
+        width = cost.shape[1]
+        hand = self.hand[act, seat, :width]
+        h = np.where(hand >= 0, hand, 0)
+        score = self.score[act, seat][:, None]
+        winning_goal = ((h == GOAL30) & (score >= 30)) | ((h == GOAL_FINAL) & (score >= 10))
+        playable = ((hand >= 0) & (cost <= self.ap[act, seat][:, None])
+                    & ~(IS_SPELL[h] & (self.weather[act] == RAIN)[:, None])
+                    & (~IS_GOAL[h] | winning_goal))
+        # 勝てるゴール > 実コストの低い順 > 手札の左から
+        key = np.where(playable, cost.astype(np.int32) * ZONE + np.arange(width), np.iinfo(np.int32).max)
+        key = np.where(winning_goal & playable, -1, key)
+        choice = key.argmin(axis=1)
+        i = np.arange(len(act))
+        can_play = playable[i, choice]
+
+        if can_play.any():
+            c = choice[can_play]
+            self._play(act[can_play], seat[can_play], c, cost[i[can_play], c], evolves[i[can_play], c])
+        if not can_play.all():
+            self._end_turn(act[~can_play])
+        self.recalc_scores(act)
+        self.steps += 1
+        return True
+
+    def run(self, max_days=30, max_steps=5000):
+        """全ゲームの決着（max_days経過は引き分け）まで進める"""
+        while self.steps < max_steps:
+            self.winner[(self.winner < 0) & (self.turn_count > max_days)] = 2  # 2 = 引き分け
+            if not self.step():
+                break
+        self.winner[self.winner < 0] = 2
+        return self.results()
+
+    def results(self):
+        return {
+            "games": self.games,
+            "p1_wins": int((self.winner == 0).sum()),
+            "p2_wins": int((self.winner == 1).sum()),
+            "draws": int((self.winner == 2).sum()),
+            "steps": self.steps,
+            "turns": self.turns,
+        }
+
+    def _play(self, rows, seats, idx, cost, evolves):
+        card = self.hand[rows, seats, idx]
+        _remove_at([(self.hand, EMPTY)], rows, seats, idx)
+        self.hand_len[rows, seats] -= 1
+        self.ap[rows, seats] -= cost
+
+        # 進化：進化元を場から外して進化先を出す
+        if evolves.any():
+            r, s, c = rows[evolves], seats[evolves], card[evolves]
+            base_idx = (self.field[r, s] == EVO_BASE[c][:, None]).argmax(axis=1)
+            self._field_remove(r, s, base_idx)
+            self._field_append(r, s, c)
+        plain = ~evolves
+        rows, seats, card = rows[plain], seats[plain], card[plain]
+        opp = 1 - seats
+
+        machine = IS_MACHINE[card]
+        if machine.any():
+            self._field_append(rows[machine], seats[machine], card[machine])
+
+        # 単純なスペル（ドロー・AP）
+        night = card == NIGHT_WORK
+        if night.any():
+            r, s = rows[night], seats[night]
+            self.hand[r, s] = EMPTY
+            self.hand_len[r, s] = 0
+            self.ap[r, s] = self.max_ap[r, s]
+            self._draw(r, s, 2)
+        for n in (1, 2, 3):
+            m = DRAW_N[card] == n
+            if m.any():
+                self._draw(rows[m], seats[m], n)
+        m = MAX_AP_DELTA[card] != 0
+        self.max_ap[rows[m], seats[m]] = np.maximum(1, self.max_ap[rows[m], seats[m]] + MAX_AP_DELTA[card[m]])
+        m = AP_GAIN[card] != 0
+        self.ap[rows[m], seats[m]] = np.minimum(self.max_ap[rows[m], seats[m]], self.ap[rows[m], seats[m]] + AP_GAIN[card[m]])
+        self.rush_used[rows[card == RUSH], seats[card == RUSH]] = True
+        self.next_weather[rows[card == CONSULT]] = SUNNY
+        m = OPP_MAX_AP_DELTA[card] != 0
+        self.max_ap[rows[m], opp[m]] = np.maximum(1, self.max_ap[rows[m], opp[m]] + OPP_MAX_AP_DELTA[card[m]])
+        m = OPP_AP_DELTA[card] != 0
+        self.ap[rows[m], opp[m]] = np.maximum(0, self.ap[rows[m], opp[m]] + OPP_AP_DELTA[card[m]])
+
+        # データ盗用：相手の手札をランダムに1枚捨てさせる
+        m = (card == DATA_THEFT) & (self.hand_len[rows, opp] > 0)
+        if m.any():
+            r, s = rows[m], opp[m]
+            pick = (self.rng.random(len(r)) * self.hand_len[r, s]).astype(np.int64)
+            _remove_at([(self.hand, EMPTY)], r, s, pick)
+            self.hand_len[r, s] -= 1
+
+        # 相手の場の破壊・停止
+        for cid, (pred, count) in DESTROY_SPELLS.items():
+            m = card == CID[cid]
+            if m.any():
+                for _ in range(count):
+                    self._destroy_best(rows[m], opp[m], pred)
+        m = card == BOUNDARY
+        if m.any():
+            r, s = rows[m], opp[m]
+            f = self.field[r, s, :max(1, int(self.field_len[r, s].max()))]
+            power = POWER[np.where(f >= 0, f, 0)] + self.bonus[r, s, :f.shape[1]]
+            # 停止していないカードを優先し、その中でパワー最大
+            key = np.where(f >= 0, power + 1000 * (self.frozen[r, s, :f.shape[1]] == 0), -1)
+            has = self.field_len[r, s] > 0
+            self.frozen[r[has], s[has], key[has].argmax(axis=1)] = 2
+
+        # 勝利条件（方針上、勝てるときにしかゴールは出さない）
+        goal = IS_GOAL[card]
+        self.winner[rows[goal]] = seats[goal]
+
+        for i in np.flatnonzero(SCALAR_CARDS[card]):
+            self._play_scalar(int(rows[i]), int(seats[i]), CARD_IDS[card[i]])
+
+    def _end_turn(self, rows):
+        # 突貫工事の反動：場の1台を破棄
+        seats = self.turn[rows]
+        rush = self.rush_used[rows, seats] & (self.field_len[rows, seats] > 0)
+        for g, s in zip(rows[rush], seats[rush]):
+            z = self._unpack(g)
+            self._sacrifice_weakest(z[s])
+            self._pack(g, z)
+            self.rush_used[g, s] = False
+
+        # 手番交代（P1のターン開始時に日付と天候を更新）
+        self.turn[rows] = 1 - self.turn[rows]
+        self.turns += len(rows)
+        seats = self.turn[rows]
+        new_day = rows[seats == 0]
+        self.turn_count[new_day] += 1
+        reserved = self.next_weather[new_day] >= 0
+        rolled = WEATHER_ROLL[self.rng.integers(0, len(WEATHER_ROLL), size=len(new_day))]
+        self.weather[new_day] = np.where(reserved, self.next_weather[new_day], rolled)
+        self.next_weather[new_day] = EMPTY
+
+        # 停止カウンターを減少
+        fr = self.frozen[rows, seats]
+        self.frozen[rows, seats] = np.where(fr > 0, fr - 1, fr)
+
+        self.max_ap[rows, seats] = np.minimum(self.max_ap[rows, seats] + 1, MAX_AP)
+
+        # 維持費計算 (事務員ボーナス含む)
+        f = self.field[rows, seats]
+        fid = np.where(f >= 0, f, 0)
+        upkeep = np.where((f >= 0) & ~self.no_upkeep[rows, seats], UPKEEP[fid], 0).sum(axis=1)
+        clerk = (f == CLERK).sum(axis=1)
+        mx = self.max_ap[rows, seats]
+        self.ap[rows, seats] = np.minimum(mx, mx - upkeep + clerk)
+
+        # 維持費不足なら払えるまで弱いカードから破棄
+        short = (self.ap[rows, seats] < 0) & (self.field_len[rows, seats] > 0)
+        for g, s in zip(rows[short], seats[short]):
+            z = self._unpack(g)
+            p = z[s]
+            while p["ap"] < 0 and p["field"]:
+                self._sacrifice_weakest(p)
+                p["ap"] = p["max_ap"] - sum(0 if c[3] else int(UPKEEP[c[0]]) for c in p["field"]) \
+                    + sum(1 for c in p["field"] if c[0] == CLERK)
+            self._pack(g, z)
+
+        # ドローフェーズ（測量データベースの追加ドローは維持費を払えたときだけ）
+        self._draw(rows, seats, 1)
+        rows, seats = rows[~short], seats[~short]
+        db = (self.field[rows, seats] == SURVEY_DB).any(axis=1)
+        self._draw(rows[db], seats[db], 1)
+
+    # --- 場の操作 ---
+
+    def _field_append(self, rows, seats, cards):
+        pos = self.field_len[rows, seats]
+        self.field[rows, seats, pos] = cards
+        self.frozen[rows, seats, pos] = 0
+        self.bonus[rows, seats, pos] = 0
+        self.no_upkeep[rows, seats, pos] = False
+        self.field_len[rows, seats] += 1
+
+    def _field_remove(self, rows, seats, idx):
+        _remove_at([(self.field, EMPTY), (self.frozen, 0), (self.bonus, 0), (self.no_upkeep, False)], rows, seats, idx)
+        self.field_len[rows, seats] -= 1
+
+    def _destroy_best(self, rows, seats, pred):
+        """条件に合う場のカードのうちパワー最大のものを墓地に送る"""
+        f = self.field[rows, seats, :max(1, int(self.field_len[rows, seats].max()))]
+        fid = np.where(f >= 0, f, 0)
+        power = POWER[fid] + self.bonus[rows, seats, :f.shape[1]]
+        ok = (f >= 0) & pred(fid, power)
+        has = ok.any(axis=1)
+        if not has.any():
+            return
+        rows, seats = rows[has], seats[has]
+        idx = np.where(ok[has], power[has], -1).argmax(axis=1)
+        pos = self.grave_len[rows, seats]
+        self.grave[rows, seats, pos] = f[has, idx]
+        self.grave_len[rows, seats] += 1
+        self._field_remove(rows, seats, idx)
+
+    # --- 1ゲームずつの処理（対象選択のあるカード） ---
+
+    def _unpack(self, g):
+        """ゲーム g の状態をPythonのリストに展開（場は [card, frozen, bonus, no_upkeep]）"""
+        z = []
+        for s in (0, 1):
+            n = self.field_len[g, s]
+            z.append({
+                "ap": int(self.ap[g, s]),
+                "max_ap": int(self.max_ap[g, s]),
+                "hand": self.hand[g, s, :self.hand_len[g, s]].tolist(),
+                "field": [list(c) for c in zip(*(arr[g, s, :n].tolist() for arr in
+                                                    (self.field, self.frozen, self.bonus, self.no_upkeep)))],
+                "deck": self.deck[g, s, self.deck_pos[g, s]:self.deck_end[g, s]].tolist(),
+                "grave": self.grave[g, s, :self.grave_len[g, s]].tolist(),
+            })
+        return z
+
+    def _pack(self, g, z):
+        for s, p in enumerate(z):
+            self.ap[g, s], self.max_ap[g, s] = p["ap"], p["max_ap"]
+            for arr, lens, cards in ((self.hand, self.hand_len, p["hand"]), (self.grave, self.grave_len, p["grave"])):
+                arr[g, s] = EMPTY
+                arr[g, s, :len(cards)] = cards
+                lens[g, s] = len(cards)
+            n = len(p["field"])
+            self.field[g, s], self.frozen[g, s], self.bonus[g, s], self.no_upkeep[g, s] = EMPTY, 0, 0, False
+            if n:
+                columns = list(zip(*p["field"]))
+                for arr, col in zip((self.field, self.frozen, self.bonus, self.no_upkeep), columns):
+                    arr[g, s, :n] = col
+            self.field_len[g, s] = n
+            self.deck[g, s, :len(p["deck"])] = p["deck"]
+            self.deck_pos[g, s], self.deck_end[g, s] = 0, len(p["deck"])
+
+    @staticmethod
+    def _power(c):
+        return int(POWER[c[0]]) + c[2]
+
+    def _sacrifice_weakest(self, p):
+        i = min(range(len(p["field"])), key=lambda i: self._power(p["field"][i]))
+        p["grave"].append(p["field"].pop(i)[0])
+
+    @staticmethod
+    def _take_best(cards, pred, key):
+        """条件に合うカードのうち key が最大のものを取り出す（なければNone）"""
+        targets = [i for i, c in enumerate(cards) if pred(c)]
+        if not targets:
+            return None
+        return cards.pop(max(targets, key=lambda i: key(cards[i])))
+
+    def _play_scalar(self, g, seat, cid):
+        z = self._unpack(g)
+        p, opp = z[seat], z[1 - seat]
+        card_power = lambda c: int(POWER[c])
+        field_power = self._power
+
+        def recover(pred, count=1):
+            for _ in range(count):
+                hit = self._take_best(p["grave"], pred, card_power)
+                if hit is None:
+                    break
+                p["hand"].append(hit)
+
+        def search(pred):
+            hit = self._take_best(p["deck"], pred, card_power)
+            if hit is not None:
+                p["hand"].append(hit)
+                self.rng.shuffle(p["deck"])
+
+        if cid == "Training":
+            targets = [c for c in p["field"] if IS_PERSONNEL[c[0]]]
+            if targets:
+                best = max(targets, key=field_power)
+                best[2] += 5
+                best[3] = True
+        elif cid == "BlueprintLoss":
+            self._take_best(opp["hand"], lambda c: True, lambda c: int(COST[c]))
+        elif cid == "AllOrNothing":
+            if self.rng.random() < 0.5:
+                p["hand"].extend(p["deck"][:5])
+                del p["deck"][:5]
+            else:
+                p["hand"] = []
+                if p["field"]:
+                    p["grave"].append(p["field"].pop(int(self.rng.integers(len(p["field"]))))[0])
+        elif cid == "Recycle":
+            recover(lambda c: IS_EQUIPMENT[c])
+        elif cid == "SurveyPlan":
+            if len(p["deck"]) >= 3:
+                top = p["deck"][:3]
+                best = max(range(3), key=lambda i: card_power(top[i]))
+                p["deck"] = [top[best]] + p["deck"][3:] + [c for i, c in enumerate(top) if i != best]
+        elif cid == "EmergencyOrder":
+            search(lambda c: IS_EQUIPMENT[c])
+        elif cid == "Dispatch":
+            search(lambda c: IS_PERSONNEL[c])
+        elif cid == "FullyPrepared":
+            if len({c[0] for c in p["field"]}) >= 5:
+                search(lambda c: IS_GOAL[c])
+        elif cid == "SiteFire":
+            opp["grave"].extend(c[0] for c in opp["field"])
+            opp["field"] = []
+            p["max_ap"] = max(1, p["max_ap"] - 2)
+        elif cid == "Rehire":
+            recover(lambda c: IS_PERSONNEL[c])
+        elif cid == "Salvage":
+            recover(lambda c: True)
+        elif cid == "Recovery":
+            recover(lambda c: True, 2)
+        elif cid == "DataRestore":
+            recover(lambda c: IS_SPELL[c])
+        self._pack(g, z)
+
+
+def simulate(deck_p1, deck_p2, games=1024, max_days=30, seed=None):
+    """deck_p1 と deck_p2 を games 回対戦させた結果"""
+    return BatchGame(deck_p1, deck_p2, games=games, seed=seed).run(max_days=max_days)
+
+
+def main():
+    parser = argparse.ArgumentParser(description="CPUデッキ同士のバッチ対戦シミュレーション")
+    parser.add_argument("--games", type=int, default=4096)
+    parser.add_argument("--max-days", type=int, default=30)
+    parser.add_argument("--seed", type=int, default=None)
+    args = parser.parse_args()
+
+    start = time.perf_counter()
+    batch = BatchGame(CPU_DECK, CPU_DECK, games=args.games, seed=args.seed)
+    result = batch.run(max_days=args.max_days)
+    elapsed = time.perf_counter() - start
+    print(result)
+    print(f"{elapsed:.2f}s, {result['turns'] / elapsed:.0f} turns/s")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,105 @@
+# -*- coding: utf-8 -*-
+"""全ルーム共通の階層型タイミングホイール
+
+持ち時間のようなタイマーをルームごとのスレッドやgreenletで待つ代わりに、
+1つのバックグラウンドタスクが TICK 秒ごとにホイールを1目盛り進める。
+
+各段は SLOTS 個のスロットを持ち、段Lの1スロットは SLOTS**L 目盛り分。
+タイマーは期限までの距離に応じた段に入り、上の段のスロットが回ってきたときに
+下の段へ移し替えられる。1目盛りあたりの処理は期限が来たタイマーと移し替えの分だけで、
+登録されているタイマーの総数には依存しない。取り消しは印を付けるだけで、
+スロットを処理するときに捨てる。
+"""
+
+import logging
+import threading
+import time
+
+TICK = 0.5  # 1目盛りの秒数
+SLOTS = 64
+LEVELS = 3  # 64**3目盛り（TICK=0.5で約36時間）まで。それより先の期限は最上段の端に入れる
+
+log = logging.getLogger(__name__)
+
+
+class Timer:
+    __slots__ = ("deadline", "fn", "args", "cancelled")
+
+    def __init__(self, deadline, fn, args):
+        self.deadline = deadline  # 何目盛り目で発火するか
+        self.fn = fn
+        self.args = args
+        self.cancelled = False
+
+
+class TimerWheel:
+    def __init__(self, tick=TICK, slots=SLOTS, levels=LEVELS):
+        self.tick = tick
+        self.slots = slots
+        self.spans = [slots ** level for level in range(levels + 1)]  # 段ごとの1スロットの目盛り数
+        self.wheels = [[[] for _ in range(slots)] for _ in range(levels)]
+        self.now = 0  # 進めた目盛り数
+        self.lock = threading.Lock()
+        self.stats = {"scheduled": 0, "fired": 0, "cancelled": 0}
+
+    def schedule(self, delay, fn, *args):
+        """delay秒後（目盛り単位で切り上げ）に fn(*args) を呼ぶ"""
+        ticks = max(1, -int(-delay // self.tick))
+        with self.lock:
+            timer = Timer(self.now + min(ticks, self.spans[-1] - 1), fn, args)
+            self._place(timer)
+            self.stats["scheduled"] += 1
+        return timer
+
+    def cancel(self, timer):
+        if not timer.cancelled:
+            timer.cancelled = True
+            self.stats["cancelled"] += 1
+
+    def advance(self):
+        """1目盛り進めて、期限の来たタイマーを呼ぶ"""
+        with self.lock:
+            self.now += 1
+            # 桁が繰り上がった段のスロットを上の段から順に下の段へ移す
+            top = 1
+            while top < len(self.wheels) and self.now % self.spans[top] == 0:
+                top += 1
+            for level in range(top - 1, 0, -1):
+                wheel = self.wheels[level]
+                index = (self.now // self.spans[level]) % self.slots
+                slot, wheel[index] = wheel[index], []
+                for timer in slot:
+                    if not timer.cancelled:
+                        self._place(timer)
+            index = self.now % self.slots
+            due, self.wheels[0][index] = self.wheels[0][index], []
+        for timer in due:
+            if timer.cancelled:
+                continue
+            self.stats["fired"] += 1
+            try:
+                timer.fn(*timer.args)
+            except Exception:
+                log.exception("timer %s failed", getattr(timer.fn, "__name__", timer.fn))
+
+    def run(self, sleep):
+        """TICK秒ごとにホイールを進め続ける（バックグラウンドタスクとして1つだけ動かす）"""
+        next_tick = time.monotonic()
+        while True:
+            next_tick += self.tick
+            delay = next_tick - time.monotonic()
+            if delay > 0:
+                sleep(delay)
+            self.advance()
+
+    def metrics(self):
+        with self.lock:
+            queued = sum(len(slot) for wheel in self.wheels for slot in wheel)  # 取り消し済みを含む
+        return dict(self.stats, queued=queued)
+
+    def _place(self, timer):
+        delta = timer.deadline - self.now
+        for level, wheel in enumerate(self.wheels):
+            if delta < self.spans[level + 1]:
+                wheel[(timer.deadline // self.spans[level]) % self.slots].append(timer)
+                return
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+"""手札・場・山札・墓地の操作
+
+ゾーンはタプルで持ち、変更するときは新しいタプルを作ってプレイヤーに代入する。
+カードの辞書も書き換えずに、変更を加えた新しい辞書に差し替える。
+こうしておけば、スナップショットや探索用の複製はプレイヤーの辞書を浅くコピーする
+だけで済み、変更されていないゾーンとカードは元の状態と共有される。
+"""
+
+import random
+
+
+def take(p, zone, i):
+    """zoneのi番目のカードを取り除いて返す"""
+    cards = p[zone]
+    i = range(len(cards))[i]  # 負のインデックスを正規化（範囲外ならIndexError）
+    p[zone] = cards[:i] + cards[i + 1:]
+    return cards[i]
+
+
+def put(p, zone, *cards):
+    """zoneの末尾にカードを加える"""
+    p[zone] = p[zone] + cards
+
+
+def move(p, src, i, dst):
+    """srcのi番目のカードをdstの末尾に移して返す"""
+    card = take(p, src, i)
+    put(p, dst, card)
+    return card
+
+
+def draw(p, n=1):
+    """山札の上からn枚（足りなければあるだけ）を手札に加え、引いた枚数を返す"""
+    drawn = p["deck"][:n]
+    p["deck"] = p["deck"][n:]
+    p["hand"] = p["hand"] + drawn
+    return len(drawn)
+
+
+def update_card(p, zone, i, **changes):
+    """zoneのi番目のカードを変更後のカードに差し替えて返す"""
+    cards = p[zone]
+    card = dict(cards[i], **changes)
+    p[zone] = cards[:i] + (card,) + cards[i + 1:]
+    return card
+
+
+def shuffle(p, zone):
+    cards = list(p[zone])
+    random.shuffle(cards)
+    p[zone] = tuple(cards)